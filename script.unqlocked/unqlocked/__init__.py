@@ -24,9 +24,6 @@ WINDOW_ID = 3000
 def log(msg):
 	xbmc.log('UNQLOCKED: ' + msg, level=xbmc.LOGDEBUG)
 
-def createTruthMatrix(height, width):
-	return [[False for col in range(width)] for row in range(height)]
-
 def gcd(a, b):
 	return a if not b else gcd(b, a % b)
 
@@ -43,7 +40,8 @@ class Time(object):
 			self.minutes = int(parts[1]) if len(parts) >= 2 else 0
 			self.seconds = int(parts[2]) if len(parts) >= 3 else -1
 		self.useSeconds = (self.seconds != -1)
-		self.seconds = 0 # Don't really store -1 for seconds
+		if not self.useSeconds:
+			self.seconds = 0 # Don't really store -1 for seconds
 		self.duration = None # By default, a time is just an instant
 	
 	def __hash__(self):
@@ -77,3 +75,63 @@ class Time(object):
 	@staticmethod
 	def fromSeconds(seconds):
 		return Time(seconds / (60 * 60), (seconds / 60) % 60, seconds % 60)
+
+
+class CellState(object):
+	'''
+	The set of highlighted cells of a matrix, as a bitset backed by an int:
+	bit (row * width + col) is set if the cell at (row, col) is highlighted.
+	A whole frame costs a few machine words, and comparing or XORing two
+	frames is a single integer operation.
+	
+	Cell states are immutable (set() returns a new state), so they can be
+	shared between states of the day and used as dictionary keys.
+	'''
+	__slots__ = ('bits',)
+	
+	def __init__(self, bits = 0):
+		self.bits = bits
+	
+	def set(self, index):
+		'''Returns a copy of this state with the cell at index highlighted'''
+		return CellState(self.bits | (1 << index))
+	
+	def test(self, index):
+		'''Returns True if the cell at index is highlighted'''
+		return (self.bits >> index) & 1 == 1
+	
+	def __iter__(self):
+		'''Iterate over the indexes of the highlighted cells, lowest first'''
+		bits = self.bits
+		while bits:
+			bit = bits & -bits
+			yield bit.bit_length() - 1
+			bits = bits ^ bit
+	
+	def popcount(self):
+		'''Returns the number of highlighted cells'''
+		return bin(self.bits).count('1')
+	
+	def __xor__(self, other):
+		return CellState(self.bits ^ other.bits)
+	
+	def __or__(self, other):
+		return CellState(self.bits | other.bits)
+	
+	def __and__(self, other):
+		return CellState(self.bits & other.bits)
+	
+	def __nonzero__(self):
+		return self.bits != 0
+	
+	def __eq__(self, other):
+		return isinstance(other, CellState) and self.bits == other.bits
+	
+	def __ne__(self, other):
+		return not self == other
+	
+	def __hash__(self):
+		return hash(self.bits)
+	
+	def __repr__(self):
+		return 'CellState(%s)' % hex(self.bits)
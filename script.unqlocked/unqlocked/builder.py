@@ -0,0 +1,113 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+from unqlocked import log
+
+import collections
+import itertools
+import Queue
+import threading
+
+# Job priorities. Lower values run first.
+PRIORITY_NOW = 0
+PRIORITY_IDLE = 1
+
+# Memory budget for pre-built layouts, in bytes
+MODEL_CACHE_SIZE = 16 * 1024 * 1024
+
+
+class Worker(threading.Thread):
+	'''
+	A background thread that runs jobs one at a time. Jobs run in order of
+	priority, and in the order they were submitted within a priority, so
+	idle-time work never delays a job the user is waiting for by more than
+	the job already running.
+	'''
+	def __init__(self):
+		super(Worker, self).__init__()
+		self.jobs = Queue.PriorityQueue()
+		self.counter = itertools.count()
+	
+	def submit(self, function, *args, **kwargs):
+		'''
+		Queue function(*args) to be run on the worker thread. The only keyword
+		argument is priority, which defaults to PRIORITY_NOW.
+		'''
+		priority = kwargs.get('priority', PRIORITY_NOW)
+		self.jobs.put((priority, next(self.counter), function, args))
+		if not self.isAlive():
+			self.start()
+	
+	def run(self):
+		while True:
+			priority, count, function, args = self.jobs.get()
+			if function is None:
+				break
+			try:
+				function(*args)
+			except:
+				log('Exception thrown in worker thread')
+		log('Worker finished shutting down')
+	
+	def stop(self):
+		'''Stop after the running job, dropping any jobs still queued'''
+		if self.isAlive():
+			self.jobs.put((PRIORITY_NOW - 1, next(self.counter), None, ()))
+			self.join()
+
+
+class ModelCache(object):
+	'''
+	A least-recently-used cache of QlockModels, keyed by layout name. The
+	cache is bounded by the estimated memory of its models (see
+	QlockModel.getSize()). The most recently added model is always kept, even
+	if it alone exceeds the capacity.
+	
+	Not thread-safe: the cache is only used from the worker thread (and from
+	the GUI thread before the worker is started).
+	'''
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.models = collections.OrderedDict()
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+	
+	def __contains__(self, name):
+		return name in self.models
+	
+	def get(self, name):
+		'''Returns the model for name and marks it as used, or None'''
+		model = self.models.pop(name, None)
+		if model is None:
+			self.misses += 1
+			return None
+		self.models[name] = model
+		self.hits += 1
+		return model
+	
+	def put(self, name, model):
+		self.discard(name)
+		self.models[name] = model
+		self.size += model.getSize()
+		while self.size > self.capacity and len(self.models) > 1:
+			oldest = next(iter(self.models))
+			log('Evicting layout %s from the model cache' % oldest)
+			self.discard(oldest)
+	
+	def discard(self, name):
+		model = self.models.pop(name, None)
+		if model is not None:
+			self.size -= model.getSize()
@@ -0,0 +1,85 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+from unqlocked import log
+
+import cPickle as pickle
+import hashlib
+import os
+
+# Bump this whenever the format of cached data changes
+CACHE_VERSION = 1
+
+
+def hashFile(path):
+	'''Returns the MD5 hex digest of a file's contents'''
+	f = open(path, 'rb')
+	try:
+		return hashlib.md5(f.read()).hexdigest()
+	finally:
+		f.close()
+
+def hashKey(key):
+	'''Returns the MD5 hex digest of a key built from plain Python values'''
+	return hashlib.md5(repr(key)).hexdigest()
+
+def stat(path):
+	'''
+	Returns the (size, mtime) of a file, or None if it doesn't exist. Used to
+	check that a file written earlier hasn't been touched since.
+	'''
+	try:
+		st = os.stat(path)
+	except OSError:
+		return None
+	return (st.st_size, st.st_mtime)
+
+def load(path, key):
+	'''
+	Load data that was previously stored with save(). The key is compared
+	to the key stored in the cache file; if they differ, the cache is stale
+	and None is returned. None is also returned if the cache doesn't exist
+	or can't be read.
+	'''
+	if not os.path.exists(path):
+		return None
+	try:
+		f = open(path, 'rb')
+		try:
+			version, cachedKey, data = pickle.load(f)
+		finally:
+			f.close()
+	except:
+		log('Error reading cache file ' + path)
+		return None
+	if version != CACHE_VERSION or cachedKey != key:
+		log('Cache file is stale: ' + path)
+		return None
+	return data
+
+def save(path, key, data):
+	'''Store data along with the key used to validate it in load()'''
+	try:
+		dir = os.path.dirname(path)
+		if not os.path.isdir(dir):
+			os.makedirs(dir)
+		f = open(path, 'wb')
+		try:
+			pickle.dump((CACHE_VERSION, key, data), f, pickle.HIGHEST_PROTOCOL)
+		finally:
+			f.close()
+		log('Wrote ' + path)
+	except:
+		log('Error writing cache file ' + path)
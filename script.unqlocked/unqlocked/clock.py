@@ -0,0 +1,117 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+from unqlocked import log
+
+import datetime
+import sys
+import time
+
+DAY = 24 * 60 * 60
+
+
+def findMonotonic():
+	'''
+	Returns a function that reads a monotonic clock in seconds. Python 2 has
+	no time.monotonic(), so the platform's clock is called through ctypes.
+	Falls back to time.time() if no monotonic clock is available.
+	'''
+	if hasattr(time, 'monotonic'):
+		return time.monotonic
+	try:
+		import ctypes
+		if sys.platform.startswith('win'):
+			getTickCount64 = ctypes.windll.kernel32.GetTickCount64
+			getTickCount64.restype = ctypes.c_ulonglong
+			return lambda: getTickCount64() / 1000.0
+		
+		class timespec(ctypes.Structure):
+			_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+		
+		CLOCK_MONOTONIC = 1 # Linux and Android
+		try:
+			clock_gettime = ctypes.CDLL(None, use_errno=True).clock_gettime
+		except AttributeError:
+			import ctypes.util
+			clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt'), use_errno=True).clock_gettime
+		clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+		
+		def monotonic():
+			ts = timespec()
+			if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+				raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+			return ts.tv_sec + ts.tv_nsec * 1e-9
+		monotonic() # Make sure it works
+		return monotonic
+	except:
+		log('No monotonic clock available, falling back to wall-clock time')
+		return time.time
+
+monotonic = findMonotonic()
+
+def wallSeconds():
+	'''Returns the wall-clock time as seconds since midnight'''
+	now = datetime.datetime.now()
+	return now.hour * 60 * 60 + now.minute * 60 + now.second + now.microsecond / 1000000.0
+
+def wrap(seconds):
+	'''Wrap a difference of two times of day into the range [-12h, 12h)'''
+	return (seconds + DAY / 2) % DAY - DAY / 2
+
+
+class WallClock(object):
+	'''
+	Maps a monotonic clock onto the wall-clock time of day. The mapping is
+	anchored to the wall clock only when checkpoint() is called; in between,
+	time is measured with the monotonic clock, so it is immune to the wall
+	clock being stepped (NTP corrections, DST, the user changing the time).
+	A difference between the projected and the actual wall-clock time at a
+	checkpoint means the wall clock jumped.
+	'''
+	def __init__(self):
+		self.anchorMonotonic = monotonic()
+		self.anchorWall = wallSeconds()
+	
+	def now(self):
+		'''The time of day, projected from the last checkpoint'''
+		return (self.anchorWall + monotonic() - self.anchorMonotonic) % DAY
+	
+	def checkpoint(self):
+		'''
+		Re-anchor to the wall clock. Returns how far the wall clock has moved
+		relative to the monotonic clock since the last checkpoint.
+		'''
+		projected = self.now()
+		self.anchorMonotonic = monotonic()
+		self.anchorWall = wallSeconds()
+		return wrap(self.anchorWall - projected)
+
+
+class VirtualClock(object):
+	'''
+	A time of day that starts at start and runs speed times faster than real
+	time. Real time is measured with the monotonic clock.
+	'''
+	def __init__(self, start, speed):
+		self.start = start
+		self.speed = speed
+		self.origin = monotonic()
+	
+	def elapsed(self):
+		'''Real seconds since the clock was created'''
+		return monotonic() - self.origin
+	
+	def now(self):
+		return (self.start + self.elapsed() * self.speed) % DAY
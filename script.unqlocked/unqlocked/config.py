@@ -14,6 +14,7 @@
 # *  http://www.gnu.org/copyleft/gpl.html
 
 from unqlocked import log, Time
+import cache
 
 import elementtree.ElementTree as ElementTree
 import os
@@ -35,15 +36,26 @@ class Config:
 		self.author     = self.addon.getAddonInfo('author')
 		self.version    = self.addon.getAddonInfo('version')
 		self.profile    = xbmc.translatePath(self.addon.getAddonInfo('profile'))
+		self.cacheDir   = os.path.join(self.profile, 'cache')
+		self.statsFile  = os.path.join(self.profile, 'stats.json') if self.addon.getSetting('stats') == 'true' else None
 		self.ssMode     = xbmc.getCondVisibility('System.ScreenSaverActive')
+		self.demoDuration = self.getDemoDuration()
 		#self.language   = self.addon.getLocalizedString
 		self.layoutDir  = os.path.join(self.cwd, 'layouts')
+		self.layouts    = LayoutIndex(self.layoutDir, os.path.join(self.cacheDir, 'layouts.index'))
 		self.layoutName = self.getLayoutFile(self.layoutDir)
 		self.layout     = Layout(os.path.join(self.layoutDir, self.layoutName))
 		self.themeDir   = os.path.join(self.cwd, 'themes')
 		self.themeName  = self.getThemeFile(self.themeDir)
 		self.theme      = Theme(os.path.join(self.themeDir, self.themeName))
 	
+	def getDemoDuration(self):
+		'''Seconds that demo mode takes to play through a whole day'''
+		try:
+			return max(1, int(self.addon.getSetting('demoduration')))
+		except ValueError:
+			return 60
+	
 	def getLayoutFile(self, layoutDir):
 		layout = self.addon.getSetting('layout')
 		if layout == 'Default':
@@ -90,14 +102,100 @@ class Config:
 				self.theme = Theme(os.path.join(self.themeDir, self.themeName))
 				break
 	
-	def loadNextLayout(self):
-		layouts = [layout for layout in os.listdir(self.layoutDir) if layout[-4:] == '.xml']
-		count = len(layouts)
-		for i in range(count):
-			if layouts[i] == self.layoutName:
-				self.layoutName = layouts[(i + 1) % count]
-				self.layout = Layout(os.path.join(self.layoutDir, self.layoutName))
+	def getNextLayout(self, height = None, width = None):
+		'''
+		Returns the name of the layout following the current one. If height
+		and width are given, layouts with different dimensions are skipped.
+		The layout index is used, so no layout files are parsed. Returns None
+		if no other layout was found.
+		'''
+		return self.layouts.next(self.layoutName, height, width)
+	
+	def loadLayout(self, layoutName):
+		'''Parse a layout without making it the current layout'''
+		return Layout(os.path.join(self.layoutDir, layoutName))
+	
+	def setLayout(self, layoutName, layout):
+		self.layoutName = layoutName
+		self.layout = layout
+
+
+class LayoutIndex:
+	'''
+	A lightweight index of the layouts in a directory. For each layout file
+	the index stores the following, without keeping the parsed layout:
+	* height, width - dimensions of the background
+	* use24 - flag for a 24-hour clock
+	* mtime - modification time of the file
+	* hash - hash of the file's contents
+	
+	The index is stored in cacheFile. Only files whose modification time has
+	changed since the index was written are read again, and then only the
+	<background> and <times> tags are parsed.
+	'''
+	def __init__(self, layoutDir, cacheFile = None):
+		self.layoutDir = layoutDir
+		self.cacheFile = cacheFile
+		cached = (cache.load(cacheFile, layoutDir) if cacheFile else None) or {}
+		self.layouts = {}
+		for layoutName in os.listdir(layoutDir):
+			if layoutName[-4:] != '.xml':
+				continue
+			mtime = os.path.getmtime(os.path.join(layoutDir, layoutName))
+			if layoutName in cached and cached[layoutName]['mtime'] == mtime:
+				self.layouts[layoutName] = cached[layoutName]
+			else:
+				try:
+					self.layouts[layoutName] = self.indexLayout(layoutName, mtime)
+				except:
+					log('Error indexing layout file ' + layoutName)
+		# Sorting the names gives a predictable order when cycling layouts
+		self.names = sorted(self.layouts.keys())
+		if cacheFile and self.layouts != cached:
+			cache.save(cacheFile, layoutDir, self.layouts)
+	
+	def indexLayout(self, layoutName, mtime):
+		path = os.path.join(self.layoutDir, layoutName)
+		entry = {'mtime': mtime, 'hash': cache.hashFile(path), 'use24': False}
+		# Stop parsing once the <background> and <times> tags have been seen
+		for event, elem in ElementTree.iterparse(path, events=('start',)):
+			if elem.tag == 'background':
+				entry['height'] = int(elem.attrib['height'])
+				entry['width'] = int(elem.attrib['width'])
+			elif elem.tag == 'times':
+				entry['use24'] = elem.attrib.get('use24') == 'true'
+			if 'height' in entry and elem.tag == 'times':
 				break
+		if 'height' not in entry:
+			raise ValueError('<background> tag missing')
+		return entry
+	
+	def next(self, layoutName, height = None, width = None):
+		'''
+		Returns the name of the layout following layoutName, skipping layouts
+		that don't match height and width (if given). Returns None if no other
+		layout matches.
+		'''
+		if layoutName in self.names:
+			start = self.names.index(layoutName)
+		else:
+			start = -1
+		count = len(self.names)
+		for i in range(1, count + 1):
+			name = self.names[(start + i) % count]
+			if name == layoutName:
+				break
+			if self.isCompatible(name, height, width):
+				return name
+		return None
+	
+	def isCompatible(self, layoutName, height, width):
+		entry = self.layouts[layoutName]
+		return (height is None or entry['height'] == height) and (width is None or entry['width'] == width)
+	
+	def compatible(self, height, width):
+		'''Returns the names of all layouts with the given dimensions'''
+		return [name for name in self.names if self.isCompatible(name, height, width)]
 
 
 class Layout:
@@ -109,9 +207,13 @@ class Layout:
 	* self.times - dictionary of time strings
 	* self.use24 - flag for a 24-hour clock
 	* self.strings - dictionary for translating numbers into strings
+	* self.file - path to the layout file
+	* self.hash - hash of the layout file's contents
 	'''
 	def __init__(self, file):
 		log('Using layout: ' + os.path.basename(file))
+		self.file = file
+		self.hash = cache.hashFile(file)
 		try:
 			root = ElementTree.parse(file).getroot()
 		except:
@@ -13,12 +13,12 @@
 # *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
 # *  http://www.gnu.org/copyleft/gpl.html
 
-from unqlocked import log, Time, WINDOW_ID
-import gui, statemachine, window
+from unqlocked import log, CellState, Time, WINDOW_ID
+import builder, cache, gui, statemachine, window
 
-import elementtree.ElementTree as ElementTree
 import os
 import shutil # for copyfile()
+from timeit import default_timer as timer
 import xbmc
 
 
@@ -29,19 +29,59 @@ class Master:
 			log('Bailing out (window already exists?)')
 			sys.exit()
 		
-		# Generate and pretty-print the GUI XML
-		windowGUI = gui.Window(config.layout, config.theme, config.ssMode)
-		windowXML = windowGUI.toXMLPrettyPlease()
+		self.createSkin(config)
+		
+		# Now create the GUI window
+		self.window = window.UnqlockedWindow('unqlocked.xml', config.profile, 'Default')
+		self.window.setConfig(config)
+		self.window.setLayoutCallback(self.layoutCallback)
+		self.window.setDemoCallback(self.demoCallback)
+		self.window.drawBackground()
+		
+		# Create the state machines. They all run on the scheduler's thread.
+		self.scheduler = statemachine.Scheduler()
+		self.window.setVisibilityCallback(self.visibilityCallback)
+		# Layouts are built on the worker thread and kept in the model cache
+		self.worker = builder.Worker()
+		self.models = builder.ModelCache(builder.MODEL_CACHE_SIZE)
+		self.prewarmed = False
+		self.demoThread = None
+		self.qlockThread = statemachine.QlockThread(self.window, config.layout, self.scheduler, config.cacheDir, config.version, config.statsFile)
+		self.models.put(config.layoutName, self.qlockThread.model)
+		#self.spriteThread = statemachine.SpriteThread(self.window, config, self.scheduler) # not implemented yet
+		
+		self.config = config
+	
+	def createSkin(self, config):
+		'''
+		Write the window XML and copy its images into a mimic skin directory
+		in the profile. The files written are recorded in a cache keyed by a
+		hash of everything the XML depends on, including the addon version (an
+		upgrade may change the generated XML); if nothing has changed and the
+		files are untouched, generation and the disk writes are skipped.
+		'''
+		windowGUI = gui.Window(config.layout, config.theme, config.ssMode, config.cacheDir)
+		key = cache.hashKey((config.version,) + windowGUI.getKey())
+		cacheFile = os.path.join(config.cacheDir, 'skin.cache')
 		
-		# Create a mimic directory that we can write to
 		skinDir = os.path.join(config.profile, 'resources', 'skins', 'Default', '720p')
+		mediaDir = os.path.join(config.profile, 'resources', 'skins', 'Default', 'media')
+		
+		stamps = cache.load(cacheFile, key)
+		if stamps and all(cache.stat(path) == stamp for path, stamp in stamps.items()):
+			log('Skin is up to date (%s)' % key)
+			return
+		
+		# Create a mimic directory that we can write to
 		if not os.path.isdir(skinDir):
 			os.makedirs(skinDir)
-		ElementTree.ElementTree(windowXML).write(os.path.join(skinDir, 'unqlocked.xml'))
-		log('Wrote ' + os.path.join(skinDir, 'unqlocked.xml'))
+		# Generate the GUI XML straight into the file
+		xmlPath = os.path.join(skinDir, 'unqlocked.xml')
+		windowGUI.write(xmlPath)
+		log('Wrote ' + xmlPath)
+		stamps = {xmlPath: cache.stat(xmlPath)}
 		
 		# Copy our images over to the new folder
-		mediaDir = os.path.join(config.profile, 'resources', 'skins', 'Default', 'media')
 		if not os.path.isdir(mediaDir):
 			os.makedirs(mediaDir)
 		# Allow layout to specify background images
@@ -54,19 +94,9 @@ class Master:
 			if not os.path.exists(newPath):
 				shutil.copyfile(imgPath, newPath)
 				log('Wrote ' + newPath)
+			stamps[newPath] = cache.stat(newPath)
 		
-		# Now create the GUI window
-		self.window = window.UnqlockedWindow('unqlocked.xml', config.profile, 'Default')
-		self.window.setConfig(config)
-		self.window.setLayoutCallback(self.layoutCallback)
-		self.window.setDemoCallback(self.demoCallback)
-		self.window.drawBackground()
-		
-		# Create the threads
-		self.qlockThread = statemachine.QlockThread(self.window, config.layout)
-		#self.spriteThread = statemachine.SpriteThread(self.window, config) # not implemented yet
-		
-		self.config = config
+		cache.save(cacheFile, key, stamps)
 	
 	def spin(self):
 		self.qlockThread.start()
@@ -80,33 +110,91 @@ class Master:
 		
 		self.window.doModal()
 		try:
+			self.worker.stop()
+			if self.demoThread:
+				self.demoThread.stop()
 			self.qlockThread.stop()
 			#self.spriteThread.stop()
+			self.scheduler.stop()
+			self.scheduler.join()
 		except:
 			log('Error occurred while stopping background threads')
 	
 	def layoutCallback(self):
-		self.qlockThread.stop()
-		# Give it some time to reacquire the lock for cleanup. When cleanup is
-		# complete, the mutex will be released, so wait on it before continuing.
-		xbmc.sleep(50)
-		self.qlockThread.waitCondition.acquire()
-		self.qlockThread.waitCondition.release()
-		
+		'''
+		Switch to the next layout with the same dimensions. The new layout is
+		parsed and solved on the worker thread while the current layout keeps
+		rendering, so the GUI thread returns immediately.
+		'''
+		self.worker.submit(self.switchLayout, timer())
+	
+	def visibilityCallback(self, visible):
+		self.scheduler.setWindowVisible(visible)
+		# The first frame is drawn before the window becomes visible. Once it
+		# is up, use the idle time to build the layouts the user can switch to.
+		# Layouts can't be switched in screensaver mode, so don't bother there.
+		if visible and not self.prewarmed and not self.config.ssMode:
+			self.prewarmed = True
+			height = self.config.layout.height
+			width = self.config.layout.width
+			for layoutName in self.config.layouts.compatible(height, width):
+				self.worker.submit(self.prewarmLayout, layoutName, priority = builder.PRIORITY_IDLE)
+	
+	def prewarmLayout(self, layoutName):
+		if layoutName in self.models:
+			return
+		model = statemachine.QlockModel(self.config.loadLayout(layoutName), self.config.cacheDir, self.config.version)
+		self.models.put(layoutName, model)
+		log('Pre-built layout %s (model cache: %d layouts, %d bytes)' % \
+			(layoutName, len(self.models.models), self.models.size))
+	
+	def switchLayout(self, requested):
 		# Must match these values (TODO: Recreate window for different-size layouts)
 		height = self.config.layout.height
 		width = self.config.layout.width
-		while True:
-			self.config.loadNextLayout()
-			if height == self.config.layout.height and width == self.config.layout.width:
-				break # Found a same-sized layout
+		layoutName = self.config.getNextLayout(height, width)
+		if not layoutName:
+			log('No other layouts with the same dimensions')
+			return
 		
+		model = self.models.get(layoutName)
+		if model is None:
+			model = statemachine.QlockModel(self.config.loadLayout(layoutName), self.config.cacheDir, self.config.version)
+			self.models.put(layoutName, model)
+		layout = model.layout
+		
+		# Hold the lock so that no tick happens between redrawing the
+		# background and swapping in the new model
+		self.qlockThread.lock.acquire()
+		self.config.setLayout(layoutName, layout)
+		self.window.drawMatrix(CellState())
 		self.window.drawBackground()
-		self.qlockThread = statemachine.QlockThread(self.window, self.config.layout)
-		self.qlockThread.start()
+		self.qlockThread.swap(model)
+		self.qlockThread.lock.release()
+		
+		latency = timer() - requested
+		self.qlockThread.stats.record('switch', latency)
+		log('Switched to layout %s in %f seconds (model cache: %d hits, %d misses)' % \
+			(layoutName, latency, self.models.hits, self.models.misses))
 	
 	def demoCallback(self):
-		pass
+		'''
+		Toggle demo mode: the clock is paused and the whole day is played in
+		config.demoDuration seconds, after which the clock resumes.
+		'''
+		if self.demoThread:
+			self.demoThread.stop()
+			return
+		self.qlockThread.pause()
+		self.demoThread = statemachine.DemoThread(self.window, self.qlockThread, self.scheduler,
+			self.config.demoDuration, callback = self.demoFinished)
+		self.demoThread.start()
+	
+	def demoFinished(self):
+		self.demoThread = None
+		# Resume the clock, unless the window is closing
+		if not self.scheduler.shouldStop():
+			self.qlockThread.resume()
 	
 	def refresh(self):
 		log('Stopping Qlock thread')
@@ -14,8 +14,10 @@
 # *  http://www.gnu.org/copyleft/gpl.html
 
 from unqlocked import log, WINDOW_ID
+import cache
 
-from elementtree.ElementTree import Element, SubElement, parse
+from elementtree.ElementTree import Element, SubElement, parse, tostring
+import bisect
 import os
 import xbmc
 
@@ -31,6 +33,9 @@ CONTROL_PANEL      = 3
 WIDTH = 500
 HEIGHT = 500
 
+# Depth of the letters' <item> nodes: window/controls/control/content/item
+LETTER_LEVEL = 4
+
 
 class Letter(object):
 	def __init__(self, index):
@@ -55,10 +60,11 @@ class Letter(object):
 
 
 class Matrix(object):
-	def __init__(self, letters, layout, theme):
+	def __init__(self, letters, layout, theme, cacheDir = None):
 		self.letters = letters
 		self.layout = layout
 		self.theme = theme
+		self.cacheDir = cacheDir
 		
 		self.posx = (1280 - WIDTH) / 2
 		self.posy = (720 - HEIGHT) / 2
@@ -71,8 +77,9 @@ class Matrix(object):
 		# Generate front name here because addItemLayout() gets called twice
 		self.font = self.getFont()
 	
-	def toXML(self):
-		'''Generate the xml representation of the letter matrix'''
+	def toXML(self, letters = None):
+		'''Generate the xml representation of the letter matrix. If letters is
+		given, it replaces the matrix's own letters.'''
 		# <control type="panel">
 		control = Element('control', type='panel', id=str(CONTROL_PANEL))
 		if True:
@@ -99,7 +106,7 @@ class Matrix(object):
 			content = SubElement(control, 'content')
 			if True:
 				# <item>
-				for letter in self.letters:
+				for letter in (self.letters if letters is None else letters):
 					content.append(letter.toXML())
 				# </item>
 			# </content>
@@ -131,64 +138,113 @@ class Matrix(object):
 		# </control>
 	
 	def getFont(self):
-		'''Parse the current skin's Font.xml file for a list of font names by
-		size'''
-		log('Loading font set from current skin: ' + xbmc.getSkinDir())
-		
-		fontName = ''
+		'''Pick the largest font from the current skin's Font.xml that fits
+		in a letter'''
 		# Use letterHeight (reasoning: WIDTH may be elastic in the future)
 		desiredSize = self.letterHeight * 1 / 2 # Decent ratio
 		fallback = 'font'
 		
-		# Font.xml can be in any resolution folder, keep trying until we find
-		# one. Use the first Font.xml we come across.
-		skinDir = xbmc.translatePath("special://skin/")
-		for item in os.listdir(skinDir):
-			fontFile = os.path.join(skinDir, item, 'Font.xml')
-			if not os.path.exists(fontFile):
-				continue
-			try:
-				root = parse(fontFile).getroot()
-			except:
-				continue
-			for set in root.findall('fontset'):
-				# Now that we've found the file, use the Default fontset
-				# (guaranteed to exist regardless of skin)
-				if 'id' not in set.attrib or set.attrib['id'] != 'Default':
-					continue
-				# Add one so we don't lie when saying "smaller" (versus "smaller than or equal to")
-				log('Font set loaded. Searching for a font smaller than %dpt' % (desiredSize + 1))
-				# Index the discovered fonts into two categories
-				fontsWithoutStyle = {}
-				fontsWithStyle = {}
-				for font in set.findall('font'):
-					if font.find('size') == None or font.find('name') == None:
-						continue
-					size = int(font.find('size').text)
-					# Skip fonts larger than the desired size
-					if size > desiredSize:
-						continue
-					if not font.find('style'):
-						fontsWithoutStyle[size] = font.find('name').text
-					else:
-						fontsWithStyle[size] = font.find('name').text
-				# Categories generated. Prefer unstyled fonts
-				if len(fontsWithoutStyle):
-					max = sorted(fontsWithoutStyle.keys(), reverse=True)[0]
-					log('Using unstyled font "%s" (%dpt)' % (fontsWithoutStyle[max], max))
-					return fontsWithoutStyle[max]
-				elif len(fontsWithStyle):
-					max = sorted(fontsWithStyle.keys(), reverse=True)[0]
-					log('Using styled font "%s" (%dpt)' % (fontsWithStyle[max], max))
-					return fontsWithStyle[max]
-				log('No suitable fonts found. Falling back to ' + fallback)
-				return fallback
+		fonts = getFontSet(self.cacheDir)
+		if fonts is None:
 			log('Default font set not found. Falling back to ' + fallback)
 			return fallback
-		log('Font.xml not found. Falling back to ' + fallback)
+		
+		# Add one so we don't lie when saying "smaller" (versus "smaller than or equal to")
+		log('Searching for a font smaller than %dpt' % (desiredSize + 1))
+		# Prefer unstyled fonts
+		for sizes, names, style in [fonts[0] + ('unstyled',), fonts[1] + ('styled',)]:
+			i = bisect.bisect_right(sizes, desiredSize)
+			if i:
+				log('Using %s font "%s" (%dpt)' % (style, names[i - 1], sizes[i - 1]))
+				return names[i - 1]
+		log('No suitable fonts found. Falling back to ' + fallback)
 		return fallback
 
 
+# Parsed font sets, keyed by skin ID
+fontSets = {}
+
+def getFontSet(cacheDir = None):
+	'''
+	Returns the Default fontset of the current skin as two (sizes, names)
+	pairs, one for unstyled and one for styled fonts, each sorted by size.
+	Returns None if the skin has no Default fontset.
+	
+	Parsing Font.xml is slow for large skins, so the result is kept in memory
+	and in cacheDir/fonts.cache (if cacheDir is given). Either copy is used
+	only if it was parsed from the same skin and Font.xml hasn't been
+	modified since.
+	'''
+	skinId = xbmc.getSkinDir()
+	cacheFile = os.path.join(cacheDir, 'fonts.cache') if cacheDir else None
+	
+	entry = fontSets.get(skinId)
+	if entry is None and cacheFile:
+		entry = cache.load(cacheFile, skinId)
+	if entry is not None:
+		fontFile, mtime, fonts = entry
+		if fontFile and getMTime(fontFile) == mtime:
+			fontSets[skinId] = entry
+			return fonts
+	
+	log('Loading font set from current skin: ' + skinId)
+	fontFile, fonts = parseFontSet()
+	entry = (fontFile, getMTime(fontFile) if fontFile else None, fonts)
+	fontSets[skinId] = entry
+	if cacheFile and fontFile:
+		cache.save(cacheFile, skinId, entry)
+	return fonts
+
+def parseFontSet():
+	'''
+	Find and parse the current skin's Font.xml. Returns the path to Font.xml
+	(or None if it wasn't found) and the fontset as described in getFontSet().
+	'''
+	# Font.xml can be in any resolution folder, keep trying until we find
+	# one. Use the first Font.xml we come across.
+	skinDir = xbmc.translatePath("special://skin/")
+	for item in os.listdir(skinDir):
+		fontFile = os.path.join(skinDir, item, 'Font.xml')
+		if not os.path.exists(fontFile):
+			continue
+		try:
+			root = parse(fontFile).getroot()
+		except:
+			continue
+		for set in root.findall('fontset'):
+			# Now that we've found the file, use the Default fontset
+			# (guaranteed to exist regardless of skin)
+			if 'id' not in set.attrib or set.attrib['id'] != 'Default':
+				continue
+			log('Font set loaded')
+			# Index the discovered fonts into two categories
+			fontsWithoutStyle = {}
+			fontsWithStyle = {}
+			for font in set.findall('font'):
+				if font.find('size') == None or font.find('name') == None:
+					continue
+				size = int(font.find('size').text)
+				if not font.find('style'):
+					fontsWithoutStyle[size] = font.find('name').text
+				else:
+					fontsWithStyle[size] = font.find('name').text
+			return fontFile, (sortFonts(fontsWithoutStyle), sortFonts(fontsWithStyle))
+		return fontFile, None
+	log('Font.xml not found')
+	return None, None
+
+def sortFonts(fonts):
+	'''Turn a dictionary of size -> name into (sizes, names) sorted by size'''
+	sizes = sorted(fonts.keys())
+	return tuple(sizes), tuple([fonts[size] for size in sizes])
+
+def getMTime(path):
+	try:
+		return os.path.getmtime(path)
+	except OSError:
+		return None
+
+
 class Sprites(object):
 	def __init__(self, layout, theme):
 		self.layout = layout
@@ -241,13 +297,26 @@ def indent(elem, level=0):
 
 
 class Window(object):
-	def __init__(self, layout, theme, screensaverMode):
+	def __init__(self, layout, theme, screensaverMode, cacheDir = None):
 		self.letters = [Letter(i) for i in range(layout.width * layout.height)]
 		self.layout = layout
 		self.theme = theme
 		self.screensaverMode = screensaverMode
+		# Create the matrix up front so that its font is resolved. The font is
+		# part of what the generated XML depends on (see getKey()).
+		self.matrix = Matrix(self.letters, self.layout, self.theme, cacheDir)
 	
-	def toXML(self):
+	def getKey(self):
+		'''
+		Returns everything the generated XML depends on. If the key hasn't
+		changed, neither has the XML.
+		'''
+		theme = self.theme
+		return (WINDOW_ID, self.layout.height, self.layout.width, theme.background,
+			theme.active, theme.inactive, theme.image, theme.imageWidth,
+			theme.imageHeight, self.screensaverMode, self.matrix.font)
+	
+	def toXML(self, letters = None):
 		# <window>
 		window = Element('window', id=str(WINDOW_ID))
 		if True:
@@ -276,8 +345,7 @@ class Window(object):
 				#controls.append(sprites.toXML())
 				
 				# <control type="panel">
-				matrix = Matrix(self.letters, self.layout, self.theme)
-				controls.append(matrix.toXML())
+				controls.append(self.matrix.toXML(letters))
 				# </control>
 			# </controls>
 		# </window>
@@ -287,4 +355,47 @@ class Window(object):
 		windowNode = self.toXML()
 		indent(windowNode)
 		return windowNode
+	
+	def iterXML(self):
+		'''
+		Generate the same text as writing out toXMLPrettyPlease(), one piece
+		at a time. Only the window without its letters is built as a tree, so
+		memory use doesn't grow with the size of the matrix.
+		'''
+		# Build the window around a single placeholder letter and split the
+		# text where the placeholder is
+		windowNode = self.toXML([Letter(-1)])
+		indent(windowNode)
+		placeholder = self.findContent(windowNode)[0]
+		head, tail = tostring(windowNode).split(tostring(placeholder))
+		
+		# Letters only differ by their index, so serialize one and substitute
+		# the index into the text for the rest
+		item = Letter(-1).toXML()
+		indent(item, LETTER_LEVEL)
+		text = tostring(item)
+		# The last item is indented back to the level of <content>
+		item.tail = placeholder.tail
+		lastText = tostring(item)
+		
+		yield head
+		count = self.layout.width * self.layout.height
+		for i in xrange(count):
+			yield (text if i < count - 1 else lastText).replace('.-1.', '.%d.' % i)
+		yield tail
+	
+	def findContent(self, windowNode):
+		'''Returns the <content> node of the letter matrix'''
+		for control in windowNode.find('controls'):
+			if control.get('id') == str(CONTROL_PANEL):
+				return control.find('content')
+	
+	def write(self, path):
+		'''Stream the window XML to a file (see iterXML())'''
+		f = open(path, 'wb')
+		try:
+			for text in self.iterXML():
+				f.write(text)
+		finally:
+			f.close()
 
@@ -0,0 +1,113 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+from unqlocked import CellState
+
+from bisect import bisect_left
+
+
+class Matcher(object):
+	'''
+	Highlights words in a matrix of cells. Each cell is allowed to be composed
+	of more than one char, such as the o' in o'clock.
+	
+	The matrix is indexed once: each row is joined into a single string, with
+	a map from char offsets back to cells. For every word in the vocabulary,
+	the index holds the cells where the word occurs in each row (sorted by
+	starting cell) and the bitmask of the cells it covers. Highlighting a
+	solution is then a binary search per word instead of a scan of the row.
+	Words that aren't in the vocabulary are indexed the first time they are
+	seen.
+	'''
+	def __init__(self, matrix, vocabulary = ()):
+		self.height = len(matrix)
+		self.width = len(matrix[0]) if self.height else 0
+		self.rows = []
+		self.cells = [] # Char offset -> cell, or None if a cell doesn't start there
+		self.ends = []  # Char offset -> cell containing that char
+		for row in matrix:
+			cells = []
+			ends = []
+			for col in range(len(row)):
+				cells.append(col)
+				cells.extend([None] * (len(row[col]) - 1))
+				ends.extend([col] * len(row[col]))
+			self.rows.append(u''.join(row))
+			self.cells.append(cells)
+			self.ends.append(ends)
+		self.index = {}
+		for word in vocabulary:
+			self.find(word)
+	
+	def find(self, word):
+		'''
+		Returns a list with one entry per row. Each entry is a tuple of three
+		lists: the starting cells of the word's occurrences, the last cells of
+		the occurrences and their bitmasks.
+		'''
+		if word in self.index:
+			return self.index[word]
+		occurrences = []
+		for row in range(self.height):
+			rowString = self.rows[row]
+			starts = []
+			ends = []
+			masks = []
+			pos = rowString.find(word)
+			while pos != -1 and pos < len(rowString):
+				start = self.cells[row][pos]
+				if start is not None:
+					# Words end on the cell containing their last char
+					end = self.ends[row][pos + len(word) - 1] if len(word) else start - 1
+					starts.append(start)
+					ends.append(end)
+					masks.append(((1 << (end - start + 1)) - 1) << (row * self.width + start))
+				pos = rowString.find(word, pos + 1)
+			occurrences.append((starts, ends, masks))
+		self.index[word] = occurrences
+		return occurrences
+	
+	def highlight(self, tokens, forceSpace = True):
+		'''
+		Highlight tokens in order as they are found in the matrix. Returns a
+		tuple of the CellState of highlighted cells and True if all tokens
+		were highlighted or False otherwise.
+		
+		Each row is searched left to right for the next token. If the token
+		isn't found, the search continues at the beginning of the next row.
+		
+		forceSpace -- if True, this won't allow consecutive tokens to be
+		highlighted.
+		Ex: row = ['a','h','a','l','f'], tokens = ['a', 'half']
+		Given the row and tokens above, only the letter 'a' will be highlighted
+		becase no space occurs between the two words. If 'half' does not occur
+		AGAIN, the highlighting operation will not fully succeed.
+		'''
+		mask = 0
+		token = 0
+		gap = 2 if forceSpace else 1
+		for row in range(self.height):
+			col = 0
+			while token < len(tokens):
+				starts, ends, masks = self.find(tokens[token])[row]
+				i = bisect_left(starts, col)
+				if i == len(starts):
+					break # Try again on the next row
+				mask = mask | masks[i]
+				col = ends[i] + gap
+				token = token + 1
+			if token == len(tokens):
+				break
+		return CellState(mask), token == len(tokens)
@@ -0,0 +1,180 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+from unqlocked import log, CellState
+
+import binascii
+import mmap
+import os
+import struct
+
+# A schedule file holds the highlight mask of every state of a layout's day.
+# Runs of consecutive states that share a mask are stored once, as a (start,
+# mask) pair. All fields are fixed-size and little-endian, so the file is
+# used in place through a read-only mmap: nothing is parsed when it is
+# loaded, and processes that map the same file share one copy of it.
+#
+# header - magic, version, mask size in bytes, delay, height, width, number
+#          of runs, the MD5 digest of the layout file and the version of the
+#          addon that wrote the file (NUL-padded)
+# runs   - for each run, the start (seconds since midnight) followed by the
+#          mask (least significant byte first)
+
+MAGIC = 'UQSC'
+VERSION = 2
+
+HEADER = struct.Struct('<4sHHIHHI16s16s')
+START = struct.Struct('<I')
+
+
+def maskSize(height, width):
+	'''Bytes needed for a mask with one bit per cell'''
+	return (height * width + 7) / 8
+
+def packMask(mask, size):
+	'''Pack a CellState into size bytes, least significant byte first'''
+	return binascii.unhexlify('%0*x' % (size * 2, mask.bits))[::-1]
+
+def unpackMask(data):
+	'''Unpack a CellState packed by packMask()'''
+	return CellState(int(binascii.hexlify(data[::-1]), 16) if len(data) else 0)
+
+def write(path, layout, delay, masks, addonVersion = ''):
+	'''
+	Write the schedule of a layout. masks yields the CellState of every state
+	of the day, spaced delay seconds apart. The file is written next to path
+	and renamed into place, so readers never see a partial file.
+	'''
+	size = maskSize(layout.height, layout.width)
+	runs = []
+	i = 0
+	for mask in masks:
+		if not len(runs) or mask != runs[-1][1]:
+			runs.append((i * delay, mask))
+		i = i + 1
+	
+	tempPath = path + '.tmp'
+	try:
+		dir = os.path.dirname(path)
+		if not os.path.isdir(dir):
+			os.makedirs(dir)
+		f = open(tempPath, 'wb')
+		try:
+			f.write(HEADER.pack(MAGIC, VERSION, size, delay, layout.height, layout.width,
+				len(runs), binascii.unhexlify(layout.hash), addonVersion))
+			for start, mask in runs:
+				f.write(START.pack(start) + packMask(mask, size))
+		finally:
+			f.close()
+		if os.path.exists(path):
+			os.remove(path) # Windows won't rename over an existing file
+		os.rename(tempPath, path)
+		log('Wrote %s (%d runs)' % (path, len(runs)))
+	except:
+		log('Error writing schedule file ' + path)
+
+
+class Schedule(object):
+	'''
+	A schedule file mapped into memory. Use load() to open one. Lookups read
+	the mapped file directly:
+	* self.delay, self.height, self.width - as given to write()
+	* self.hash - MD5 hex digest of the layout the schedule was built from
+	* self.addonVersion - version of the addon that wrote the schedule
+	* self.count - number of runs
+	'''
+	def __init__(self, path):
+		f = open(path, 'rb')
+		try:
+			self.map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+		finally:
+			f.close() # The mapping stays valid
+		magic, version, self.maskSize, self.delay, self.height, self.width, self.count, digest, \
+			addonVersion = HEADER.unpack_from(self.map, 0)
+		if magic != MAGIC or version != VERSION:
+			self.close()
+			raise ValueError('Not a schedule file (or an old version): ' + path)
+		self.hash = binascii.hexlify(digest)
+		self.addonVersion = addonVersion.rstrip('\0')
+		self.recordSize = START.size + self.maskSize
+		if len(self.map) != HEADER.size + self.count * self.recordSize:
+			self.close()
+			raise ValueError('Truncated schedule file: ' + path)
+	
+	def __len__(self):
+		return self.count
+	
+	def getStart(self, run):
+		return START.unpack_from(self.map, HEADER.size + run * self.recordSize)[0]
+	
+	def getMask(self, run):
+		offset = HEADER.size + run * self.recordSize + START.size
+		return unpackMask(self.map[offset : offset + self.maskSize])
+	
+	def findRun(self, seconds):
+		'''Returns the index of the run in effect at the given time of day'''
+		seconds = seconds % (24 * 60 * 60)
+		lo = 0
+		hi = self.count
+		# Find the last run that starts at or before seconds. The first run
+		# starts at midnight.
+		while hi - lo > 1:
+			mid = (lo + hi) / 2
+			if self.getStart(mid) <= seconds:
+				lo = mid
+			else:
+				hi = mid
+		return lo
+	
+	def nextChange(self, seconds):
+		'''
+		Returns the start of the first run after the given time of day. Every
+		run starts with a change of mask, except maybe the first one: it's a
+		continuation of the last run if they have the same mask.
+		'''
+		run = self.findRun(seconds) + 1
+		if run < self.count:
+			return self.getStart(run)
+		if self.count > 1 and self.getMask(self.count - 1) == self.getMask(0):
+			return self.getStart(1)
+		return self.getStart(0)
+	
+	def lookup(self, seconds):
+		'''Returns the mask in effect at the given time of day'''
+		return self.getMask(self.findRun(seconds))
+	
+	def close(self):
+		self.map.close()
+
+
+def load(path, layout, delay, addonVersion = ''):
+	'''
+	Map the schedule at path. Returns None if the file doesn't exist, can't
+	be read, or wasn't built from this layout with this delay by this version
+	of the addon (a new version may solve or highlight differently).
+	'''
+	if not os.path.exists(path):
+		return None
+	try:
+		schedule = Schedule(path)
+	except:
+		log('Error reading schedule file ' + path)
+		return None
+	if (schedule.hash, schedule.delay, schedule.height, schedule.width, schedule.addonVersion) != \
+			(layout.hash, delay, layout.height, layout.width, addonVersion):
+		log('Schedule file is stale: ' + path)
+		schedule.close()
+		return None
+	return schedule
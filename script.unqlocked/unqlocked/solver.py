@@ -15,6 +15,7 @@
 
 from unqlocked import log, Time
 
+from bisect import bisect_right
 from copy import deepcopy
 
 
@@ -34,6 +35,10 @@ class Constant(Token):
 	
 	def __unicode__(self):
 		return self.name
+	
+	def compile(self):
+		'''Returns the pre-split words of this constant'''
+		return splitWords(unicode(self))
 
 
 class Symbol(Token):
@@ -92,6 +97,19 @@ class Symbol(Token):
 		if id not in self.stringTable:
 			log('Error: no string defined for id %d' % id)
 		return self.stringTable.get(id, '')
+	
+	def compile(self):
+		'''
+		Evaluate the transform for every possible value of the unit. Returns a
+		tuple of missing string table IDs and a tuple of pre-split words, both
+		indexed by the value of the unit. If the string table has no entry for
+		the ID, the missing IDs are (id,) and the words are empty; otherwise
+		there are no missing IDs.
+		'''
+		ids = [self.transform(x) for x in range(24 if self.unit == 'h' else 60)]
+		missing = tuple([() if id in self.stringTable else (id,) for id in ids])
+		words = tuple([splitWords(unicode(self.stringTable.get(id, ''))) for id in ids])
+		return missing, words
 
 
 class Compound(Token):
@@ -104,6 +122,99 @@ class Compound(Token):
 	
 	def __unicode__(self):
 		return u''.join([unicode(part) for part in self.parts])
+	
+	def getUnits(self):
+		'''Returns the set of units used by the symbols in this compound'''
+		return set([part.unit for part in self.parts if isinstance(part, Symbol)])
+	
+	def compile(self):
+		'''
+		Evaluate the compound for every possible value of its unit. Like
+		Symbol.compile(), returns a tuple of missing string table IDs and a
+		tuple of pre-split words, both indexed by the value of the unit; a
+		symbol with a missing ID contributes an empty string to the word. Only
+		valid for compounds whose symbols all share the same unit.
+		'''
+		unit = list(self.getUnits())[0]
+		missing = []
+		words = []
+		for x in range(24 if unit == 'h' else 60):
+			ids = []
+			strings = []
+			for part in self.parts:
+				if isinstance(part, Symbol):
+					id = part.transform(x)
+					if id not in part.stringTable:
+						ids.append(id)
+					strings.append(part.stringTable.get(id, ''))
+				else:
+					strings.append(part.name)
+			missing.append(tuple(ids))
+			words.append(splitWords(u''.join([unicode(string) for string in strings])))
+		return tuple(missing), tuple(words)
+
+
+def splitWords(s):
+	'''
+	Multi-word strings need to be split up, such as in the case:
+	<string id="25">twenty five</string>
+	An empty string (string table ID not found) has no words.
+	'''
+	return tuple(s.split(' ')) if s != '' else ()
+
+
+# Slot units in a Template. Each indexes the (hours, minutes, seconds) tuple,
+# except for constant words and dynamic tokens.
+UNITS = {'h': 0, 'm': 1, 's': 2}
+CONSTANT = -1
+DYNAMIC = -2
+
+
+class Template(object):
+	'''
+	A rule compiled into a flat sequence of parts. Each part is one of:
+	(CONSTANT, words) - a tuple of pre-split constant words
+	(unit, (missing, words)) - a symbol slot; the time's value for the unit
+	                           indexes a tuple of pre-split words, and a
+	                           tuple of string table IDs to log as missing
+	(DYNAMIC, token) - a compound token that mixes units, stringified on the
+	                   fly against the RuleChain's time source
+	
+	Adjacent constants are merged, so rendering a rule is a few tuple
+	concatenations with no lambdas or string splitting.
+	'''
+	def __init__(self, rule):
+		self.parts = []
+		for token in rule:
+			if isinstance(token, Constant):
+				words = token.compile()
+				if len(self.parts) and self.parts[-1][0] == CONSTANT:
+					self.parts[-1] = (CONSTANT, self.parts[-1][1] + words)
+				elif len(words):
+					self.parts.append((CONSTANT, words))
+			elif isinstance(token, Symbol):
+				self.parts.append((UNITS[token.unit], token.compile()))
+			elif len(token.getUnits()) == 1:
+				unit = UNITS[list(token.getUnits())[0]]
+				self.parts.append((unit, token.compile()))
+			else:
+				self.parts.append((DYNAMIC, token))
+	
+	def render(self, hours, minutes, seconds):
+		'''Returns a tuple of words for the given time'''
+		values = (hours, minutes, seconds)
+		tokens = ()
+		for unit, data in self.parts:
+			if unit == CONSTANT:
+				tokens += data
+			elif unit == DYNAMIC:
+				tokens += splitWords(unicode(data))
+			else:
+				value = values[unit]
+				for id in data[0][value]:
+					log('Error: no string defined for id %d' % id)
+				tokens += data[1][value]
+		return tokens
 
 
 class RuleNode(object):
@@ -122,7 +233,8 @@ class RuleChain(object):
 	A RuleChain is where the majority of the effort goes in solving for a given
 	time. RuleChain construction occurs by adding rules via add(), which then
 	builds up a sequence of how the time should be represented for the given
-	hour.
+	hour. Once all rules are added, flatten() turns the linked lists into
+	sorted arrays that are searched by lookup().
 	'''
 	def __init__(self, strings, timeSource, use24, use0, defaultDuration):
 		self.strings = strings
@@ -132,6 +244,10 @@ class RuleChain(object):
 		self.defaultDuration = defaultDuration
 		# Initialize the rule chain with empty nodes
 		self.rules = [None for i in range(24 if self.use24 else 12)]
+		# Flattened copy of the rule chain, built by flatten() once all rules
+		# have been added
+		self.starts = None
+		self.table = None
 	
 	def add(self, timeObject, timeString, rule = None):
 		'''
@@ -145,6 +261,10 @@ class RuleChain(object):
 		'''
 		log('Adding rule %s: ' % str(timeObject) + timeString.encode('utf-8'))
 		
+		# Adding a rule invalidates the flattened chain
+		self.starts = None
+		self.table = None
+		
 		# Use 1-based time for rule resolution
 		timeObject.hours = (timeObject.hours - 1) % (24 if self.use24 else 12) + 1
 		
@@ -184,7 +304,7 @@ class RuleChain(object):
 	
 	def insert(self, node, rule, time, ruleChainHour):
 		'''
-		Recursive functions can get really tricky really quickly sticky.
+		Inserting into a rule chain can get really tricky really quickly sticky.
 		
 		Ideally, this docstring would contain some helpful hints. Here's some
 		terminology:
@@ -197,7 +317,7 @@ class RuleChain(object):
 		other rules. The code is now much more complex, because each hour has
 		to be properly partitioned by rules defined in all hours; and not only
 		this, but this partitioned time has to be represented by linked lists
-		and everything has to occur recursively.
+		and every case has to be handled while walking down the chain.
 		
 		Keep in mind: Constants ALWAYS have a duration (if it isn't explicitly
 		declared, then it defaults to the GCD). Rule with no duration are
@@ -205,212 +325,246 @@ class RuleChain(object):
 		duration; this acts to give them a lower priority in times past the end
 		of the duration and a higher priority in times during the duration.
 		
-		The return value of this function is a RuleNode which (in the first
-		level deep) becomes the new root node for that hour in the RuleChain.
-		Therefore, it is helpful to think of the return value as a way to
-		modify the parent node's next node.
+		The return value of this function is a RuleNode which becomes the new
+		root node for that hour in the RuleChain. Within the walk, it is
+		helpful to think of each pass as a way to modify the parent node's
+		next node.
 		'''
-		# If true, rule will override node during conflicts
-		precedence = ruleChainHour >= time.hours
-		
-		if node == None:
-			# Base case: insert a new node into the rule chain by creating it
-			# and setting its child to this node.
-			return RuleNode(rule, time, node)
-		
-		# Assume the same hour as the node so comparisons will work
-		tempTime = Time(node.time.hours, time.minutes, time.seconds)
-		tempTime.duration = time.duration
-		
-		# At the highest level, we consider three cases: the time attached to
-		# this rule is either before, equal to, or after the time of this node.
-		
-		if tempTime.toSeconds() < node.time.toSeconds():
-			# Time occurs before this node. In all cases, the rule is prepended
-			# to the chain. Keep in mind, a time with no duration is basically
-			# a time with infinite duration. Also keep in mind, Constants
-			# ALWAYS have a duration.
-			if not time.duration:
-				return RuleNode(rule, time, node)
+		# Each pass either finishes the insertion or moves on to a node further
+		# down the chain, the way the recursive version of this function used
+		# to. parent is the node whose next link receives the result of the
+		# pass; the head of the chain hangs off a placeholder.
+		head = RuleNode(None, None, node)
+		parent = head
+		while True:
+			# If true, rule will override node during conflicts
+			precedence = ruleChainHour >= time.hours
 			
-			# Three cases: rules don't overlap, rules overlap partially, rules overlap fully
-			# Case 1: rules don't overlap
-			if tempTime.end() <= node.time.toSeconds():
-				return RuleNode(rule, time, node)
+			if node == None:
+				# Base case: insert a new node into the rule chain by creating it
+				# and setting its child to this node.
+				parent.next = RuleNode(rule, time, node)
+				return head.next
 			
-			# Case 2: rules overlap partially
-			if tempTime.end() < node.time.end():
+			# Assume the same hour as the node so comparisons will work
+			tempTime = Time(node.time.hours, time.minutes, time.seconds)
+			tempTime.duration = time.duration
+			
+			# At the highest level, we consider three cases: the time attached to
+			# this rule is either before, equal to, or after the time of this node.
+			
+			if tempTime.toSeconds() < node.time.toSeconds():
+				# Time occurs before this node. In all cases, the rule is prepended
+				# to the chain. Keep in mind, a time with no duration is basically
+				# a time with infinite duration. Also keep in mind, Constants
+				# ALWAYS have a duration.
+				if not time.duration:
+					parent.next = RuleNode(rule, time, node)
+					return head.next
+			
+				# Three cases: rules don't overlap, rules overlap partially, rules overlap fully
+				# Case 1: rules don't overlap
+				if tempTime.end() <= node.time.toSeconds():
+					parent.next = RuleNode(rule, time, node)
+					return head.next
+			
+				# Case 2: rules overlap partially
+				if tempTime.end() < node.time.end():
+					if precedence:
+						# Move node into the furture and shorten its duration
+						newBeginning = Time.fromSeconds(tempTime.end())
+						newDuration = node.time.duration.toSeconds() - (node.time.end() - tempTime.end())
+						newBeginning.duration = Time.fromSeconds(newDuration)
+						node.time = newBeginning
+						parent.next = RuleNode(rule, time, node)
+						return head.next
+					else:
+						# Shorten time
+						time.duration = Time.fromSeconds(node.time.toSeconds() - tempTime.toSeconds())
+						parent.next = RuleNode(rule, time, node)
+						return head.next
+			
+				# Case 3: node is fully overlapped by rule
+				# time.end() >= node.time.end()
 				if precedence:
-					# Move node into the furture and shorten its duration
-					newBeginning = Time.fromSeconds(tempTime.end())
-					newDuration = node.time.duration.toSeconds() - (node.time.end() - tempTime.end())
-					newBeginning.duration = Time.fromSeconds(newDuration)
-					node.time = newBeginning
-					return RuleNode(rule, time, node)
+					# Not including this node in the return statement effectively
+					# eliminates it. However, things aren't this simple. We need to
+					# check if the next node is partially/fully consumed on the
+					# next pass.
+					node = node.next
+					continue
 				else:
-					# Shorten time
-					time.duration = Time.fromSeconds(node.time.toSeconds() - tempTime.toSeconds())
-					return RuleNode(rule, time, node)
+					# Split the rule into two nodes that fall on either side of
+					# this node. We create the following chain:
+					# parent node -> node1 -> node -> node2 -> node.next
+					time1 = time.copy()
+					time1.duration = Time.fromSeconds(node.time.toSeconds() - tempTime.toSeconds())
+					node1 = RuleNode(rule, time1, node)
+					time2 = Time.fromSeconds(node.time.end())
+					time2.hours = time.hours # Use original hours to maintain precedence
+					time2.duration = Time.fromSeconds(tempTime.end() - node.time.end())
+					# Keep going, because time2 might extend past node.next
+					parent.next = node1
+					parent = node
+					node = node.next
+					time = time2
+					continue
 			
-			# Case 3: node is fully overlapped by rule
-			# time.end() >= node.time.end()
-			if precedence:
-				# Not including this node in the return statement effectively
-				# eliminates it. However, things aren't this simple. We need to
-				# check if the next node is partially/fully consumed via
-				# recursion.
-				return self.insert(node.next, rule, time, ruleChainHour)
-			else:
-				# Split the rule into two nodes that fall on either side of
-				# this node. We create the following chain:
-				# parent node -> node1 -> node -> node2 -> node.next
-				time1 = time.copy()
-				time1.duration = Time.fromSeconds(node.time.toSeconds() - tempTime.toSeconds())
-				node1 = RuleNode(rule, time1, node)
-				time2 = Time.fromSeconds(node.time.end())
-				time2.hours = time.hours # Use original hours to maintain precedence
-				time2.duration = Time.fromSeconds(tempTime.end() - node.time.end())
-				# Use recursion, because time2 might extend past node.next
-				node2 = self.insert(node.next, rule, time2, ruleChainHour)
-				node.next = node2
-				return node1
-		
-		# The case where rule occured before node was relatively straightforward.
-		# Now, rule and node occur at the same time, which means that most
-		# likely either rule or node is omitted.
-		if tempTime.toSeconds() == node.time.toSeconds():
-			if not precedence:
-				# Ignore the rule
-				return node
+			# The case where rule occured before node was relatively straightforward.
+			# Now, rule and node occur at the same time, which means that most
+			# likely either rule or node is omitted.
+			if tempTime.toSeconds() == node.time.toSeconds():
+				if not precedence:
+					# Ignore the rule
+					parent.next = node
+					return head.next
 			
-			# We've established that the rule has precedence. Now it's just a
-			# matter of finding out how much of node (and its children) to
-			# delete.
+				# We've established that the rule has precedence. Now it's just a
+				# matter of finding out how much of node (and its children) to
+				# delete.
 			
-			# Three cases
-			# Case 1: No rule duration
-			if not tempTime.duration:
-				# Replace the node
-				return RuleNode(rule, time, node.next)
+				# Three cases
+				# Case 1: No rule duration
+				if not tempTime.duration:
+					# Replace the node
+					parent.next = RuleNode(rule, time, node.next)
+					return head.next
 			
-			# Case 2: Rule duration, but no node duration
-			if not node.time.duration:
-				# Peek ahead at the future node
-				if node.next:
-					tempTime2 = Time(node.next.time.hours, time.minutes, time.seconds)
-					tempTime2.duration = time.duration
-					if tempTime2.end() > node.next.time.toSeconds():
-						# This node is fully engulfed. Replace the node, and
-						# make sure that we replace any other overlapped nodes
-						# (recursively, of course)
-						# parent node -> node1 -> node.next
-						node1 = self.insert(node.next, rule, time, ruleChainHour)
-						return node1
-				# Make this node start at the end of this rule
-				node.time = Time.fromSeconds(tempTime.end())
-				return RuleNode(rule, time, node)
+				# Case 2: Rule duration, but no node duration
+				if not node.time.duration:
+					# Peek ahead at the future node
+					if node.next:
+						tempTime2 = Time(node.next.time.hours, time.minutes, time.seconds)
+						tempTime2.duration = time.duration
+						if tempTime2.end() > node.next.time.toSeconds():
+							# This node is fully engulfed. Replace the node, and
+							# make sure that we replace any other overlapped nodes
+							# (on the following passes, of course)
+							# parent node -> node1 -> node.next
+							node = node.next
+							continue
+					# Make this node start at the end of this rule
+					node.time = Time.fromSeconds(tempTime.end())
+					parent.next = RuleNode(rule, time, node)
+					return head.next
 			
-			# Case 3: Rule duration AND node duration. Let the battle begin!
-			if tempTime.end() >= node.time.end():
-				# Replace the node and any following nodes if necessary
-				node1 = self.insert(node.next, rule, time, ruleChainHour)
-				return node1
-			else:
-				# Chop off and preserve the dangling part
-				end = node.time.end()
-				node.time = Time.fromSeconds(tempTime.end())
-				# node.time.hours is already set because tempTime.hours was copied earlier
-				node.time.duration = Time.fromSeconds(end - tempTime.end())
-				return RuleNode(rule, time, node)
-		
-		# Rule occurs in the future: tempTime.toSeconds() > node.time.toSeconds()
-		
-		# Three cases: rules don't overlap, rules overlap partially, rules overlap fully
-		# Case 1
-		if node.time.end() <= tempTime.toSeconds():
-			# If node.rule is a constant, it doesn't need to persist after its duration
-			if not tempTime.duration or self.isConstant(node.rule):
-				# Regular rule or node is constant, recurse deeper
-				node.next = self.insert(node.next, rule, time, ruleChainHour)
-				return node
-			else:
-				# Peek ahead at the future node
-				if node.next:
-					tempTime2 = Time(node.next.time.hours, time.minutes, time.seconds)
-					tempTime2.duration = time.duration
-					if tempTime2.toSeconds() > node.next.time.toSeconds():
-						# Next node is in the future too, recurse deeper
-						node.next = self.insert(node.next, rule, time, ruleChainHour)
-						return node
+				# Case 3: Rule duration AND node duration. Let the battle begin!
+				if tempTime.end() >= node.time.end():
+					# Replace the node and any following nodes if necessary
+					node = node.next
+					continue
+				else:
+					# Chop off and preserve the dangling part
+					end = node.time.end()
+					node.time = Time.fromSeconds(tempTime.end())
+					# node.time.hours is already set because tempTime.hours was copied earlier
+					node.time.duration = Time.fromSeconds(end - tempTime.end())
+					parent.next = RuleNode(rule, time, node)
+					return head.next
+			
+			# Rule occurs in the future: tempTime.toSeconds() > node.time.toSeconds()
+			
+			# Three cases: rules don't overlap, rules overlap partially, rules overlap fully
+			# Case 1
+			if node.time.end() <= tempTime.toSeconds():
+				# If node.rule is a constant, it doesn't need to persist after its duration
+				if not tempTime.duration or self.isConstant(node.rule):
+					# Regular rule or node is constant, go deeper
+					parent.next = node
+					parent = node
+					node = node.next
+					continue
+				else:
+					# Peek ahead at the future node
+					if node.next:
+						tempTime2 = Time(node.next.time.hours, time.minutes, time.seconds)
+						tempTime2.duration = time.duration
+						if tempTime2.toSeconds() > node.next.time.toSeconds():
+							# Next node is in the future too, go deeper
+							parent.next = node
+							parent = node
+							node = node.next
+							continue
 				
-				# tempTime has a duration so node should persist after rule's completion
-				# To do so, we dupe node and let recursion do the rest
-				timeCopy = Time.fromSeconds(tempTime.toSeconds())
-				if node.time.duration:
-					# Need to modify duration of both old and new time
-					timeCopy.duration = Time.fromSeconds(node.time.end() - tempTime.toSeconds())
+					# tempTime has a duration so node should persist after rule's completion
+					# To do so, we dupe node and let the next iteration do the rest
+					timeCopy = Time.fromSeconds(tempTime.toSeconds())
+					if node.time.duration:
+						# Need to modify duration of both old and new time
+						timeCopy.duration = Time.fromSeconds(node.time.end() - tempTime.toSeconds())
+						node.time = node.time.copy()
+						node.time.duration = Time.fromSeconds(tempTime.toSeconds() - node.time.toSeconds())
+					nodeCopy = RuleNode(node.rule, timeCopy, node.next)
+					parent.next = node
+					parent = node
+					node = nodeCopy
+					continue
+			
+			# Implicit that node.time.duration exists
+			# Case 2
+			if tempTime.end() > node.time.end():
+				# Implicit that tempTime.duration exists
+				if precedence:
+					# Shorten node
 					node.time = node.time.copy()
 					node.time.duration = Time.fromSeconds(tempTime.toSeconds() - node.time.toSeconds())
-				nodeCopy = RuleNode(node.rule, timeCopy, node.next)
-				node.next = self.insert(nodeCopy, rule, time, ruleChainHour)
-				return node
-		
-		# Implicit that node.time.duration exists
-		# Case 2
-		if tempTime.end() > node.time.end():
-			# Implicit that tempTime.duration exists
-			if precedence:
-				# Shorten node
+					# Link in the new node after this one
+					node.next = RuleNode(rule, time, node.next)
+					parent.next = node
+					return head.next
+				else:
+					# Shorten rule by giving it a later starting time
+					time2 = Time.fromSeconds(node.time.end())
+					time2.hours = time.hours # Use original hours to maintain precedence
+					time2.duration = Time.fromSeconds(tempTime.end() - node.time.end())
+					node.next = RuleNode(rule, time2, node.next)
+					parent.next = node
+					return head.next
+			
+			# Case 3: node.time has a duration and tempTime occurs in the middle of it
+			if not precedence:
+				if tempTime.duration:
+					# tempTime is fully engulfed by node
+					parent.next = node
+					return head.next
+				else:
+					# tempTime is a rule, so it continues past node
+					time2 = Time.fromSeconds(node.time.end())
+					parent.next = node
+					parent = node
+					node = node.next
+					time = time2
+					continue
+			if not tempTime.duration:
+				# tempTime is a regular rule, so chop node in half and occupy the
+				# second half with this rule
 				node.time = node.time.copy()
 				node.time.duration = Time.fromSeconds(tempTime.toSeconds() - node.time.toSeconds())
 				# Link in the new node after this one
 				node.next = RuleNode(rule, time, node.next)
-				return node
-			else:
-				# Shorten rule by giving it a later starting time
-				time2 = Time.fromSeconds(node.time.end())
-				time2.hours = time.hours # Use original hours to maintain precedence
-				time2.duration = Time.fromSeconds(tempTime.end() - node.time.end())
-				node.next = RuleNode(rule, time2, node.next)
-				return node
-		
-		# Case 3: node.time has a duration and tempTime occurs in the middle of it
-		if not precedence:
-			if tempTime.duration:
-				# tempTime is fully engulfed by node
-				return node
-			else:
-				# tempTime is a rule, so it continues past node
-				time2 = Time.fromSeconds(node.time.end())
-				node.next = self.insert(node.next, rule, time2, ruleChainHour)
-				return node
-		if not tempTime.duration:
-			# tempTime is a regular rule, so chop node in half and occupy the
-			# second half with this rule
-			node.time = node.time.copy()
-			node.time.duration = Time.fromSeconds(tempTime.toSeconds() - node.time.toSeconds())
-			# Link in the new node after this one
-			node.next = RuleNode(rule, time, node.next)
-			return node
-		if tempTime.end() == node.time.end():
-			# Ends coincide. Things are easy, just chop and link
-			node.time = node.time.copy()
-			node.time.duration = Time.fromSeconds(tempTime.toSeconds() - node.time.toSeconds())
-			# Link in the new node after this one
-			node.next = RuleNode(rule, time, node.next)
-			return node
-		# Things are messy. Bisect node:
-		# parent node -> node(1) -> rule -> node(2) -> node.next
-		# Go from last to first. Start with second node:
-		time2 = Time.fromSeconds(tempTime.end())
-		time2.duration = Time.fromSeconds(node.time.end() - tempTime.end())
-		node2 = RuleNode(node.rule, time2, node.next)
-		newNode = RuleNode(rule, time, node2)
-		time1 = node.time.copy()
-		time1.duration = Time.fromSeconds(tempTime.toSeconds() - node.time.toSeconds())
-		node.time = time1
-		node.next = newNode
-		return node
+				parent.next = node
+				return head.next
+			if tempTime.end() == node.time.end():
+				# Ends coincide. Things are easy, just chop and link
+				node.time = node.time.copy()
+				node.time.duration = Time.fromSeconds(tempTime.toSeconds() - node.time.toSeconds())
+				# Link in the new node after this one
+				node.next = RuleNode(rule, time, node.next)
+				parent.next = node
+				return head.next
+			# Things are messy. Bisect node:
+			# parent node -> node(1) -> rule -> node(2) -> node.next
+			# Go from last to first. Start with second node:
+			time2 = Time.fromSeconds(tempTime.end())
+			time2.duration = Time.fromSeconds(node.time.end() - tempTime.end())
+			node2 = RuleNode(node.rule, time2, node.next)
+			newNode = RuleNode(rule, time, node2)
+			time1 = node.time.copy()
+			time1.duration = Time.fromSeconds(tempTime.toSeconds() - node.time.toSeconds())
+			node.time = time1
+			node.next = newNode
+			parent.next = node
+			return head.next
 	
 	def isConstant(self, rule):
 		'''
@@ -491,51 +645,114 @@ class RuleChain(object):
 		
 		return parts
 	
+	def flatten(self):
+		'''
+		Flatten the linked lists into arrays. For each hour, self.starts holds
+		the start of every node (in seconds past the hour) and self.table holds
+		the node's rule, compiled into a Template, at the same position. This
+		way a lookup is a binary search instead of a recursive walk down the
+		chain.
+		
+		The walk in the linked list always starts at the first node and stops
+		at the first following node that starts after the given time, so the
+		start of each following node is clamped to the largest start seen
+		since the first node. The first node's start is never compared (it
+		is stored as-is and skipped by the search), so it takes no part in
+		the clamping. This keeps the searched part of the arrays sorted (and
+		bisect-able) and makes the results identical to traversing the chain.
+		'''
+		self.starts = []
+		self.table = []
+		# Rules are shared between hours and nodes, so only compile them once
+		templates = {}
+		for node in self.rules:
+			starts = []
+			rules = []
+			latest = 0
+			while node:
+				start = node.time.toSeconds() - node.time.hours * 3600
+				if len(starts):
+					latest = max(latest, start)
+					start = latest
+				starts.append(start)
+				if id(node.rule) not in templates:
+					templates[id(node.rule)] = Template(node.rule)
+				rules.append(templates[id(node.rule)])
+				node = node.next
+			self.starts.append(starts)
+			self.table.append(rules)
+	
 	def lookup(self, time):
 		'''
 		Solve for the given time. Because the heavy lifting was done when
 		creating the RuleChain, looking up a rule is a straightforward task.
-		Once the rule is located, stringify-ing is as simple as converting each
-		token to its unicode representation.
-		'''
-		ruleChain = self.rules[time.hours % (24 if self.use24 else 12)]
-		tokens = []
-		for token in self.lookupRecursive(ruleChain, time):
-			s = unicode(token)
-			if s == '':
-				continue # Error - string table ID not found
-			# Need to split up multi-word tokens, such as in the case:
-			# <string id="25">twenty five</string>
-			tokens.extend(s.split(' ') if ' ' in s else [s])
-		return tokens
+		Once the rule is located, its template renders it into a tuple of
+		words.
+		'''
+		if self.starts is None:
+			self.flatten()
+		hour = time.hours % (24 if self.use24 else 12)
+		template = self.lookupRule(hour, time.minutes * 60 + time.seconds)
+		if template is None:
+			return ()
+		return template.render(time.hours, time.minutes, time.seconds)
 	
-	def lookupRecursive(self, node, time):
-		'''Basic linked list node transversal'''
-		if node == None:
+	def lookupRule(self, hour, seconds):
+		'''
+		Find the template of the rule in effect the given number of seconds
+		past the hour. The first node is used even if it starts later than
+		the time.
+		'''
+		rules = self.table[hour]
+		if not len(rules):
 			log('ERROR: No node, returning []')
-			return []
-		
-		if node.next == None:
-			# Base case: next node is null, return this one
-			return node.rule
-		
-		# Compare minutes and seconds (by making the hours equal)
-		tempTime = Time(node.next.time.hours, time.minutes, time.seconds)
-		if tempTime.toSeconds() < node.next.time.toSeconds():
-			# Base case: time comes before node.time, so return node.rule
-			return node.rule
-		
-		return self.lookupRecursive(node.next, time)
+			return None
+		return rules[bisect_right(self.starts[hour], seconds, 1) - 1]
+	
+	def lookupRange(self, start, stop, step):
+		'''
+		Generator that solves for every time in range(start, stop, step)
+		(seconds since midnight, wrapped to a day), yielding (seconds, tokens)
+		pairs. Within an hour, consecutive times reuse the position of the
+		previous rule instead of searching again from the first node, so a
+		sweep costs one step along the chain per rule. The time source is
+		updated before each rule is rendered.
+		'''
+		if self.starts is None:
+			self.flatten()
+		hours = 24 if self.use24 else 12
+		hour = None
+		previous = i = 0
+		for seconds in xrange(start, stop, step):
+			timeOfDay = seconds % (24 * 60 * 60)
+			self.timeSource.hours = timeOfDay / (60 * 60)
+			self.timeSource.minutes = (timeOfDay / 60) % 60
+			self.timeSource.seconds = timeOfDay % 60
+			offset = timeOfDay % (60 * 60)
+			
+			if self.timeSource.hours % hours != hour or offset < previous:
+				# New hour (or went backwards), search from the first node
+				hour = self.timeSource.hours % hours
+				starts = self.starts[hour]
+				rules = self.table[hour]
+				i = bisect_right(starts, offset, 1) - 1
+			else:
+				# Walk forward from the rule in effect for the previous time
+				while i + 1 < len(starts) and starts[i + 1] <= offset:
+					i = i + 1
+			previous = offset
+			
+			if not len(rules):
+				log('ERROR: No node, returning []')
+				yield seconds, ()
+				continue
+			yield seconds, rules[i].render(self.timeSource.hours, self.timeSource.minutes, self.timeSource.seconds)
 	
 	def countNodes(self):
 		'''Returns a count of nodes in this RuleChain'''
-		nodes = 0
-		for i in range(len(self.rules)):
-			nodes = nodes + self.countRecursive(self.rules[i])
-		return nodes
-	
-	def countRecursive(self, node):
-		return 1 + self.countRecursive(node.next) if node else 0
+		if self.starts is None:
+			self.flatten()
+		return sum([len(rules) for rules in self.table])
 
 
 class Solver(object):
@@ -543,6 +760,10 @@ class Solver(object):
 		self.strings = layout.strings
 		# Time reference used to stringify symbols
 		self.time = Time(0, 0, 0)
+		# States are spaced by the default duration (the GCD of all times)
+		self.delay = defaultDuration
+		# Full-day solution table, populated by compile()
+		self.table = None
 		
 		# Use 0 only for 24-hour mode, unless a 0 is found in 12-hour mode or
 		# a 24 is found in 24-hour mode
@@ -560,12 +781,22 @@ class Solver(object):
 			timeString = layout.times[timeObject]
 			timeObject.hours = timeObject.hours % 12
 			self.rules.add(timeObject, timeString)
+		self.rules.flatten()
 	
-	def resolveTime(self, time):
+	def compile(self):
 		'''
-		Resolving a time is simple: update the time reference, lookup the rule
-		and convert the tokens to strings.
+		Solve for every state of the day in advance. The table holds one tuple
+		of tokens per state, spaced self.delay seconds apart (288 states for a
+		5-minute layout, 1440 for a 1-minute layout), and is indexed by
+		seconds / self.delay. Once compiled, resolveTime() is a simple lookup.
+		Other components are free to read self.table, but shouldn't modify it.
 		'''
+		if self.table is not None:
+			return # Already compiled
+		self.table = [tokens for seconds, tokens in self.resolveRange()]
+	
+	def lookup(self, time):
+		'''Solve for the given time by walking the RuleChain'''
 		# Symbols resolve themselves against self.time, so clone the fields
 		# instead of overwriting the object
 		self.time.hours = time.hours
@@ -573,6 +804,34 @@ class Solver(object):
 		self.time.seconds = time.seconds
 		return self.rules.lookup(time)
 	
+	def resolveTime(self, time):
+		'''
+		Resolving a time is simple: if the solver has been compiled, index
+		the table. Otherwise, update the time reference, lookup the rule and
+		convert the tokens to strings.
+		'''
+		if self.table is not None:
+			return self.table[time.toSeconds() % (24 * 60 * 60) / self.delay]
+		return self.lookup(time)
+	
+	def resolveRange(self, start = 0, stop = 24 * 60 * 60, step = None):
+		'''
+		Generator that resolves every time in range(start, stop, step), in
+		seconds since midnight, and yields (seconds, tokens) pairs. Times past
+		midnight wrap around. The step defaults to self.delay, so by default
+		the whole day is streamed one state at a time. Like resolveTime(),
+		this indexes the table if the solver has been compiled and walks the
+		RuleChain otherwise.
+		'''
+		if step is None:
+			step = self.delay
+		if self.table is not None:
+			for seconds in xrange(start, stop, step):
+				yield seconds, self.table[seconds % (24 * 60 * 60) / self.delay]
+		else:
+			for pair in self.rules.lookupRange(start, stop, step):
+				yield pair
+	
 	def countNodes(self):
 		'''
 		For statistical purposes, the number of nodes in the RuleChain can be
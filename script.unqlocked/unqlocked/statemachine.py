@@ -13,210 +13,721 @@
 # *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
 # *  http://www.gnu.org/copyleft/gpl.html
 
-from unqlocked import log, createTruthMatrix, gcd, WINDOW_ID, Time
-import solver
+from unqlocked import log, gcd, CellState, Time
+import clock, matcher, schedule, solver, stats
 
-from copy import deepcopy
+import array
+import bisect
 import datetime
+import errno
+import heapq
+import os
+import select
+import socket
+import sys
 import threading
-import xbmc # for getCondVisibility()
+from timeit import default_timer as timer
 
 
-class StateMachine(threading.Thread):
+# Longest time to sleep without checking the wall clock for a jump
+MAX_SLEEP = 60 # seconds
+
+# Differences between the monotonic and wall clocks smaller than this are
+# considered drift, not a jump
+JUMP_TOLERANCE = 0.5 # seconds
+
+
+# Machines due within this many seconds of each other are run on the same
+# wake-up
+COALESCE_WINDOW = 0.005 # seconds
+
+# Frame rate of demo mode
+DEMO_FPS = 30
+
+# A frame due sooner than this after the previous one is drawn is dropped
+MIN_FRAME_SLEEP = 0.001 # seconds
+
+
+class Waker(object):
+	'''
+	A self-pipe that lets other threads interrupt the scheduler's sleep. The
+	sleep is a select() with a relative timeout, so it blocks in the kernel
+	until the timeout expires or wake() writes to the pipe. (On Python 2,
+	a timed Condition.wait() polls every few milliseconds until a deadline
+	on the wall clock, so it is neither idle nor immune to clock jumps.)
+	
+	A wake-up that arrives before wait() is called isn't lost: the byte stays
+	in the pipe and the next wait() returns immediately.
+	'''
+	def __init__(self):
+		if sys.platform.startswith('win'):
+			# select() only accepts sockets on Windows, so connect a pair of
+			# loopback sockets instead of using a pipe
+			server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			server.bind(('127.0.0.1', 0))
+			server.listen(1)
+			writer = socket.create_connection(server.getsockname())
+			reader = server.accept()[0]
+			server.close()
+			reader.setblocking(False)
+			writer.setblocking(False)
+			self.reader = reader
+			self.send = writer.send
+			self.recv = reader.recv
+			self.files = [reader, writer]
+		else:
+			import fcntl
+			readFd, writeFd = os.pipe()
+			for fd in (readFd, writeFd):
+				fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+			self.reader = readFd
+			self.send = lambda data: os.write(writeFd, data)
+			self.recv = lambda size: os.read(readFd, size)
+			self.files = [os.fdopen(readFd, 'rb'), os.fdopen(writeFd, 'wb')]
+	
+	def wait(self, timeout = None):
+		'''Sleep until wake() is called or timeout seconds have passed'''
+		try:
+			ready = select.select([self.reader], [], [], timeout)[0]
+		except (select.error, socket.error) as e:
+			if e.args[0] != errno.EINTR:
+				raise
+			return
+		if len(ready):
+			try:
+				while self.recv(4096):
+					pass
+			except (socket.error, OSError):
+				pass # Drained
+	
+	def wake(self):
+		try:
+			self.send('x')
+		except (socket.error, OSError):
+			pass # The pipe is full, so a wake-up is already pending
+	
+	def close(self):
+		for f in self.files:
+			f.close()
+
+
+class Scheduler(threading.Thread):
+	'''
+	A single thread that runs every registered state machine. Each machine
+	asks to be woken at the boundary of its next state; the scheduler keeps
+	these deadlines in a heap and sleeps until the earliest one. Machines
+	whose boundaries fall on the same instant are run on a single wake-up.
+	Starting, stopping and swapping machines doesn't create new threads.
+	
+	Sleeping is done against a monotonic deadline, by blocking on a Waker for
+	the time remaining, and the wall clock is only consulted at checkpoints:
+	when waking up, and at least every MAX_SLEEP seconds while sleeping. If
+	the wall clock jumps, every machine is run straight away and skips to its
+	latest state.
+	
+	The window reports its visibility through setWindowVisible(). When the
+	window closes, the scheduler is woken immediately and stops every machine.
+	'''
+	def __init__(self):
+		super(Scheduler, self).__init__()
+		self._stop = False
+		# Held while the scheduler isn't sleeping, so machines run under it
+		self.lock = threading.RLock()
+		self.waker = Waker()
+		# When we first start the scheduler, the window might not be active
+		# yet. Keep track of whether we sight the window; if it subsequently
+		# falls off the map, we know we should stop
+		self.windowSighted = False
+		self.windowVisible = False
+		self.wallClock = clock.WallClock()
+		self.heap = []
+		self.entries = {} # machine -> heap entry
+		self.counter = 0 # Tie-breaker for entries with the same deadline
+		self.wakeups = 0
+	
+	def register(self, machine):
+		'''Add a machine and run it as soon as possible'''
+		self.lock.acquire()
+		self.schedule(machine, clock.monotonic())
+		if not self.isAlive():
+			self.start()
+		self.waker.wake()
+		self.lock.release()
+	
+	def unregister(self, machine):
+		'''Remove a machine. Returns False if it wasn't registered.'''
+		self.lock.acquire()
+		try:
+			if machine not in self.entries:
+				return False
+			# Entries are removed lazily, so just invalidate it
+			self.entries.pop(machine)[2] = None
+			return True
+		finally:
+			self.lock.release()
+	
+	def wake(self, machine):
+		'''Run a registered machine as soon as possible'''
+		self.lock.acquire()
+		if machine in self.entries:
+			self.schedule(machine, clock.monotonic())
+			self.waker.wake()
+		self.lock.release()
+	
+	def setWindowVisible(self, visible):
+		'''Called by the window when it is shown or closed'''
+		self.lock.acquire()
+		self.windowVisible = visible
+		if visible:
+			self.windowSighted = True
+		self.waker.wake()
+		self.lock.release()
+	
+	def shouldStop(self):
+		'''Machines stop when the window isn't visible after once being visible'''
+		return self.windowSighted and not self.windowVisible
+	
+	def schedule(self, machine, deadline):
+		if machine in self.entries:
+			self.entries[machine][2] = None
+		entry = [deadline, self.counter, machine]
+		self.counter = self.counter + 1
+		self.entries[machine] = entry
+		heapq.heappush(self.heap, entry)
+	
+	def run(self):
+		self.lock.acquire()
+		while not self._stop:
+			if self.shouldStop() and len(self.entries):
+				log('Window closed, stopping all state machines')
+				self.finishAll()
+			
+			# Discard invalidated entries
+			while len(self.heap) and self.heap[0][2] is None:
+				heapq.heappop(self.heap)
+			
+			if not len(self.heap):
+				# Nothing to do until a machine is registered
+				self.sleep(None)
+				continue
+			
+			remaining = self.heap[0][0] - clock.monotonic()
+			if remaining > 0:
+				self.sleep(min(remaining, MAX_SLEEP))
+				jump = self.wallClock.checkpoint()
+				if abs(jump) > JUMP_TOLERANCE:
+					log('Wall clock jumped by %f seconds while sleeping' % jump)
+					for machine in self.entries.keys():
+						self.schedule(machine, clock.monotonic())
+				continue
+			
+			# Collect every machine due at this boundary
+			due = []
+			limit = clock.monotonic() + COALESCE_WINDOW
+			while len(self.heap) and self.heap[0][0] <= limit:
+				entry = heapq.heappop(self.heap)
+				if entry[2] is not None:
+					due.append(entry[2])
+					del self.entries[entry[2]]
+			self.wakeups = self.wakeups + 1
+			
+			jump = self.wallClock.checkpoint()
+			if abs(jump) > JUMP_TOLERANCE:
+				log('Wall clock jumped by %f seconds' % jump)
+			now = self.wallClock.now()
+			anchor = clock.monotonic()
+			for machine in due:
+				wait = machine.tick(now)
+				if wait is None:
+					# The machine has run its course
+					machine.finish()
+					continue
+				# A wait below zero means the boundary was missed by a slow tick
+				self.schedule(machine, anchor + max(wait, 0))
+				log('Sleeping for %f seconds' % (self.entries[machine][0] - clock.monotonic()))
+		
+		# Shut down any machines that are still running
+		self.finishAll()
+		self.lock.release()
+		self.waker.close()
+		log('Scheduler finished shutting down after %d wake-ups' % self.wakeups)
+	
+	def sleep(self, timeout):
+		'''Release the lock and sleep until woken or timeout seconds pass'''
+		self.lock.release()
+		try:
+			self.waker.wait(timeout)
+		finally:
+			self.lock.acquire()
+	
+	def finishAll(self):
+		for machine in self.entries.keys():
+			machine.finish()
+		self.entries = {}
+		self.heap = []
+	
+	def stop(self):
+		self.lock.acquire()
+		self._stop = True
+		self.waker.wake()
+		self.lock.release()
+
+
+class StateMachine(object):
 	'''
 	Representation of a state machine, where the state is defined by a
 	reference to an internal (fake) clock or an external (real) clock,
 	and the only transition between states occurs as a transition between
 	two different times.
+	
+	State machines don't have threads of their own. Once started, they are
+	run by a Scheduler, which calls tick() at the boundary of each state.
 	'''
-	def __init__(self, delay):
-		super(StateMachine, self).__init__()
-		self._stop = False
-		self.waitCondition = threading.Condition()
+	def __init__(self, delay, scheduler, statsFile = None):
+		self.scheduler = scheduler
+		# Ticks happen with this lock held, so acquire it to keep the state
+		# machine from running
+		self.lock = scheduler.lock
 		self.delay = delay
 		
-		# Calculate the initial state from the current time
+		# Timing statistics, written to statsFile (if set) when the machine stops
+		self.stats = stats.TickStats()
+		self.statsFile = statsFile
+		
+		self.rewind()
+	
+	def rewind(self):
+		'''Calculate the state from the current time, rounding down'''
 		now = datetime.datetime.now()
 		seconds = now.hour * 60 * 60 + now.minute * 60 + now.second
-		
-		# Round the time down
 		self.state = Time.fromSeconds(seconds / self.delay * self.delay)
+		self.firstStep = True
+	
+	def start(self):
+		self.scheduler.register(self)
+	
+	def pause(self):
+		'''Remove the machine from the scheduler without cleaning up'''
+		self.scheduler.unregister(self)
+	
+	def resume(self):
+		'''Start a paused machine again from the current time'''
+		self.lock.acquire()
+		self.rewind()
+		self.start()
+		self.lock.release()
+	
+	def tick(self, now):
+		'''
+		Visit the current state, given the time of day. If the boundary was
+		missed (or the clock jumped), stale states are skipped and the latest
+		state is visited instead. Returns the number of seconds from now until
+		tick() should be called next, or None if the machine is done (in which
+		case the scheduler calls finish()).
 		
-		# When we first start the thread, the window might not be active yet.
-		# Keep track of whether we sight the window; if it subsequently falls
-		# off the map, we know we should exit
-		self.windowSighted = False
+		The wait is a distance rather than a time of day because the next
+		boundary can be more than 12 hours away (a display that doesn't change
+		until tomorrow), which a time of day can't tell apart from a boundary
+		that was missed.
+		'''
+		# Seconds since the boundary of the current state
+		lateness = clock.wrap(now - self.state.toSeconds())
+		if -JUMP_TOLERANCE < lateness < 0:
+			# Woke up a little early, go back to sleep until the boundary
+			return -lateness
+		
+		# Skip to the latest state if the boundary was missed (or if the
+		# clock jumped backwards)
+		latest = int(now) / self.delay * self.delay
+		if latest != self.state.toSeconds():
+			if not self.firstStep:
+				log('Skipping from state %s to %s' % (str(self.state), str(Time.fromSeconds(latest))))
+			self.state = Time.fromSeconds(latest)
+			lateness = now - latest
+		
+		# The first state was rounded down, so its lateness is meaningless
+		if not self.firstStep:
+			self.stats.record('lateness', lateness)
+			log('Woke up %f ms after the boundary' % (lateness * 1000))
+		self.firstStep = False
+		
+		# Allow the subclass to update the GUI
+		log('StateMachine: visiting state ' + str(self.state))
+		start = timer()
+		self.step(self.state)
+		self.stats.record('step', timer() - start)
+		
+		# Compute the next state. A boundary at the same time of day as this
+		# one is a whole day away.
+		current = self.state.toSeconds()
+		next = self.nextBoundary(current) % (24 * 60 * 60)
+		self.state = Time.fromSeconds(next)
+		return ((next - current - 1) % (24 * 60 * 60) + 1) - lateness
 	
-	def run(self):
-		self.waitCondition.acquire()
-		while not self.shouldStop():
-			# Allow the subclass to update the GUI
-			log('StateMachine: visiting state ' + str(self.state))
-			self.step(self.state)
-			
-			# Compute the next state
-			next = (self.state.toSeconds() + self.delay) % (24 * 60 * 60)
-			self.state = Time.fromSeconds(next)
-			
-			# Calculate the delay
-			now = datetime.datetime.now()
-			seconds = now.hour * 60 * 60 + now.minute * 60 + now.second + now.microsecond / 1000000.0
-			delay = self.state.toSeconds() - seconds
-			if delay < 0:
-				delay = delay + 24 * 60 * 60
-			log('Sleeping for %f seconds' % delay)
-			self.waitCondition.wait(delay)
-		#except:
-		#	log('Exception thrown in StateMachine thread')
-		#	self.waitCondition.release()
-		#	self.stop()
+	def nextBoundary(self, seconds):
+		'''
+		Returns the start of the state following the one that starts at the
+		given time of day. Subclasses can skip states that wouldn't change
+		anything.
+		'''
+		return seconds + self.delay
+	
+	def getStats(self):
+		'''
+		Returns a summary of the timing statistics of recent ticks. See
+		stats.TickStats for the fields.
+		'''
+		return self.stats.summary()
+	
+	def finish(self):
+		'''Clean up after the machine has been removed from the scheduler'''
 		log('StateMachine shutting down')
 		self.cleanup()
-		self.waitCondition.release()
+		self.stats.log()
+		if self.statsFile:
+			self.stats.dump(self.statsFile)
 		log('StateMachine finished shutting down')
 	
-	def shouldStop(self):
+	def stop(self):
 		'''
-		Two conditions result in stopping: a call to stop(), or the window not
-		being visible after once being visible.
+		Remove the machine from the scheduler and clean up. When this returns,
+		the machine won't be run again.
 		'''
-		visible = xbmc.getCondVisibility('Window.IsVisible(%s)' % WINDOW_ID)
-		if self.windowSighted and not visible:
-			return True
-		elif visible:
-			self.windowSighted = True
-		return self._stop
-	
-	def stop(self):
-		self.waitCondition.acquire()
-		self._stop = True
-		self.waitCondition.notifyAll()
-		self.waitCondition.release()
+		self.lock.acquire()
+		if self.scheduler.unregister(self):
+			self.finish()
+		self.lock.release()
 
 
-class QlockThread(StateMachine):
-	def __init__(self, window, layout):
-		delay = self.calcDelay(layout)
-		super(QlockThread, self).__init__(delay)
-		self.window = window
+class QlockModel(object):
+	'''
+	Everything QlockThread needs to draw a layout: the highlight mask of
+	every state of the day. Building a model (solving and highlighting the
+	whole day) is the expensive part of switching layouts, so it can be done
+	on any thread and then swapped into a running QlockThread.
+	
+	The masks are stored compactly, as they have to scale to layouts with
+	1-second resolution (86,400 states): self.masks holds each distinct mask
+	once, packed into self.maskSize bytes as in a schedule file, and
+	self.states holds the index of every state's mask in an array. Masks are
+	only unpacked into a CellState by highlight(). The solver and its
+	solutions are only needed while building.
+	
+	If cacheDir is given, the masks of the whole day are also exported to a
+	schedule file there. Later models for the same layout map that file
+	instead of building a solver and highlighting (see schedule.Schedule).
+	Either way, resolve() and highlight() give the mask for a time of day.
+	
+	A model that was built (rather than mapped) also records the states whose
+	solution couldn't be fully highlighted in self.failures, as a list of
+	(seconds, solution, withoutSpaces) tuples, where withoutSpaces is True if
+	highlighting succeeded once words were allowed to run together. If the
+	day has already been solved, pass the compiled solver as clockSolver.
+	
+	Schedule files are tagged with addonVersion, and only reused by the same
+	version of the addon.
+	'''
+	def __init__(self, layout, cacheDir = None, addonVersion = '', clockSolver = None):
+		self.layout = layout
+		self.delay = self.calcDelay(layout)
+		self.size = None
+		self.schedule = None
+		self.failures = None
+		self.solutionCount = None
+		self.maskSize = schedule.maskSize(layout.height, layout.width)
 		
-		# Use a lowercase matrix for comparison
-		self.layout = deepcopy(layout)
-		for row in range(self.layout.height):
-			for col in range(self.layout.width):
-				self.layout.matrix[row][col] = self.layout.matrix[row][col].lower()
+		scheduleFile = None
+		if cacheDir:
+			name = os.path.splitext(os.path.basename(layout.file))[0]
+			scheduleFile = os.path.join(cacheDir, name + '.schedule')
+			self.schedule = schedule.load(scheduleFile, layout, self.delay, addonVersion)
+			if self.schedule:
+				log('Mapped schedule with %d runs' % len(self.schedule))
+				return
 		
 		log('Creating the solver')
-		now = datetime.datetime.now()
-		start = now.hour * 60 * 60 + now.minute * 60 + now.second + now.microsecond / 1000000.0
+		start = timer()
 		
-		# Let the solver know about the default delay. It will need this
-		# information once it has parsed a times string into tokens.
-		self.solver = solver.Solver(layout, delay)
+		if not clockSolver:
+			# Let the solver know about the default delay. It will need this
+			# information once it has parsed a times string into tokens.
+			clockSolver = solver.Solver(layout, self.delay)
 		
-		nodes = self.solver.countNodes()
-		now = datetime.datetime.now()
-		stop = now.hour * 60 * 60 + now.minute * 60 + now.second + now.microsecond / 1000000.0
-		log('Solver created in %f seconds with %d nodes and %d rules' % (stop - start, nodes, len(layout.times)))
+		created = timer()
+		log('Solver created in %f seconds with %d nodes and %d rules' % \
+			(created - start, clockSolver.countNodes(), len(layout.times)))
+		
+		# Index the lowercase matrix. Words are indexed as they are first seen.
+		matrix = [[char.lower() for char in row] for row in layout.matrix]
+		highlighter = matcher.Matcher(matrix)
+		
+		# Solve and highlight the whole day in one pass, streaming the states
+		# from the solver instead of compiling a table, so that only distinct
+		# solutions are held while building. Each solution is highlighted once,
+		# and each distinct mask is packed with one bit per cell.
+		solutionIds = {} # solution -> mask id
+		failed = {} # solution -> highlighted without spaces
+		maskIds = {} # packed mask -> mask id
+		masks = []
+		states = array.array('i')
+		self.failures = []
+		solution = None
+		for seconds, tokens in clockSolver.resolveRange():
+			if tokens != solution:
+				solution = tokens
+				maskId = solutionIds.get(solution)
+				if maskId is None:
+					mask, retried = self.createMask(highlighter, solution, seconds)
+					if retried is not None:
+						failed[solution] = retried
+					packed = schedule.packMask(mask, self.maskSize)
+					maskId = maskIds.get(packed)
+					if maskId is None:
+						maskId = maskIds[packed] = len(masks)
+						masks.append(packed)
+					solutionIds[solution] = maskId
+			states.append(maskId)
+			# Every state that shows a failed solution, not just the first one
+			if solution in failed:
+				self.failures.append((seconds, solution, failed[solution]))
+		self.solutionCount = len(solutionIds)
+		self.masks = ''.join(masks)
+		self.states = array.array('H', states) if len(masks) <= 0xFFFF else states
+		log('Solved and highlighted %d states (%d solutions, %d distinct masks) in %f seconds' % \
+			(len(states), len(solutionIds), len(masks), timer() - created))
+		
+		# Find the states whose mask differs from the previous state's, so that
+		# the clock can sleep from one visible change to the next
+		states = self.states
+		self.changes = array.array('i', (i * self.delay for i in xrange(len(states)) if states[i] != states[i - 1]))
+		log('%d of %d states change the display' % (len(self.changes), len(states)))
+		
+		if scheduleFile:
+			schedule.write(scheduleFile, layout, self.delay, (self.highlight(i) for i in states), addonVersion)
 	
-	def step(self, time):
-		# Ask the solver for the time
-		log('Solving for the current time (%s)' % str(time))
-		solution = self.solver.resolveTime(time)
-		solutionUTF8 = [uni.encode('utf-8') for uni in solution]
-		log('Solution: ' + str(solutionUTF8))
-		
-		truthMatrix = createTruthMatrix(self.layout.height, self.layout.width)
-		success = self.highlight(self.layout.matrix, truthMatrix, solution)
+	def resolve(self, seconds):
+		'''
+		Returns the state in effect at the given time of day: the index of
+		its mask, or the run of the schedule. Pass it to highlight() for the
+		mask itself.
+		'''
+		if self.schedule:
+			return self.schedule.findRun(seconds)
+		return self.states[seconds % (24 * 60 * 60) / self.delay]
+	
+	def highlight(self, state):
+		'''Returns the mask of a state given by resolve()'''
+		if self.schedule:
+			return self.schedule.getMask(state)
+		offset = state * self.maskSize
+		return schedule.unpackMask(self.masks[offset : offset + self.maskSize])
+	
+	def nextChange(self, seconds):
+		'''
+		Returns the time of day of the first state after the given time whose
+		mask differs from the state before it. The result is smaller than
+		seconds if the next change is tomorrow.
+		'''
+		if self.schedule:
+			return self.schedule.nextChange(seconds)
+		changes = self.changes
+		i = bisect.bisect_right(changes, seconds % (24 * 60 * 60))
+		if i < len(changes):
+			return changes[i]
+		# Tomorrow's first change (or midnight, if the display never changes)
+		return changes[0] if len(changes) else 0
+	
+	def createMask(self, highlighter, solution, seconds):
+		'''
+		Highlight a solution. Returns a tuple of the CellState of highlighted
+		cells and, if the solution couldn't be highlighted with spaces between
+		words, whether highlighting succeeded without them (None otherwise).
+		'''
+		mask, success = highlighter.highlight(solution)
+		retried = None
 		if not success:
-			log('Unable to highlight solution. Reattempting with no spaces between words')
-			truthMatrix = createTruthMatrix(self.layout.height, self.layout.width)
-			success = self.highlight(self.layout.matrix, truthMatrix, solution, False)
-			if success:
+			solutionUTF8 = [uni.encode('utf-8') for uni in solution]
+			time = Time.fromSeconds(seconds)
+			time.useSeconds = self.delay % 60 != 0
+			log('Unable to highlight solution for %s: %s' % (str(time), str(solutionUTF8)))
+			log('Reattempting with no spaces between words')
+			mask, retried = highlighter.highlight(solution, False)
+			if retried:
 				log('Success')
 			else:
 				log('Failed to highlight solution again. Drawing best attempt')
-		
-		# Draw the result
-		self.window.drawMatrix(truthMatrix)
-	
-	def highlight(self, charMatrix, truthMatrix, tokens, forceSpace = True):
-		'''
-		Highlight tokens in truthMatrix as they are found in charMatrix.
-		This function returns True if all tokens are highlighted sucessfully,
-		and False otherwise.
-		'''
-		for row in range(self.layout.height):
-			if not len(tokens):
-				break
-			consumed = self.highlightRow(charMatrix[row], row, truthMatrix, tokens, forceSpace)
-			tokens = tokens[consumed:] # snip snip
-		return len(tokens) == 0
-	
-	def highlightRow(self, charRow, row, truthMatrix, tokens, forceSpace = True):
-		'''
-		Highlight tokens in a row of chars (and each char is allowed to be
-		composed of more than one char, such as in o'clock). row is used to
-		keep track of the row in truthMatrix to highlight values on. The return
-		value is the number of tokens consumed.
-		
-		forceSpace -- if True, this won't allow consecutive tokens to be
-		highlighted.
-		Ex: charRow = ['a','h','a','l','f'], tokens = ['a', 'half']
-		Given charRow and tokens above, only the letter 'a' will be highlighted
-		becase no space occurs between the two words. If 'half' does not occur
-		AGAIN, the highlighting operation will not fully succeed.
-		'''
-		tokensCopy = tokens # Shallow copy (deep is done via slice later)
-		# Use a while loop, because looping over a range doesn't let you
-		# arbitrarily increment the loop counter
-		i = 0
-		while i < len(charRow):
-			# No tokens means we're all done
-			if len(tokens) == 0:
-				break
-			token = tokens[0]
-			
-			# Convert the (useful part of) charRow to a string for comparison
-			if ''.join(charRow[i:]).startswith(token):
-				# Found a match
-				while len(token):
-					truthMatrix[row][i] = True
-					
-					# Don't just pop 1 char, because charRow[i] might be longer
-					# than a single char (such as the o' in o'clock)
-					token = token[len(charRow[i]):]
-					i = i + 1
-				
-				# If forceSpace is False, we need to allow consecutive words.
-				# i was set to the end of the token, but we increment i as part
-				# of the while loop, so the end result is that consecutive words
-				# are automatically avoided. To reverse this, decrement i to
-				# cancel out the while loop's increment (Post-mortem: we could
-				# also just *continue*, but where's the fun in that?)
-				if not forceSpace:
-					i = i - 1
-				
-				# Elements have been highlighted, move on to the next token
-				tokens = tokens[1:]
-			i = i + 1 # Move on to the next token
-		return len(tokensCopy) - len(tokens)
+		return mask, retried
+	
+	@staticmethod
+	def calcDelay(layout):
+		'''The delay is calculated from the GCD of all time entries'''
+		return reduce(gcd, [time.toSeconds() for time in layout.times.keys()])
+	
+	def getSize(self):
+		'''
+		Estimate the memory held by this model, in bytes: the masks and the
+		state arrays, or the mapped schedule.
+		'''
+		if self.size is None and self.schedule:
+			self.size = len(self.schedule.map)
+		elif self.size is None:
+			size = sys.getsizeof(self.masks)
+			for indexes in (self.states, self.changes):
+				size += sys.getsizeof(indexes) + len(indexes) * indexes.itemsize
+			self.size = size
+		return self.size
+
+
+class QlockThread(StateMachine):
+	def __init__(self, window, layout, scheduler, cacheDir = None, addonVersion = '', statsFile = None):
+		self.model = QlockModel(layout, cacheDir, addonVersion)
+		super(QlockThread, self).__init__(self.model.delay, scheduler, statsFile)
+		self.window = window
+	
+	def step(self, time):
+		# Solve for the time, fetch its precomputed mask and draw the result
+		start = timer()
+		state = self.model.resolve(time.toSeconds())
+		solved = timer()
+		mask = self.model.highlight(state)
+		highlighted = timer()
+		updates = self.window.drawMatrix(mask)
+		drawn = timer()
+		self.stats.record('solve', solved - start)
+		self.stats.record('highlight', highlighted - solved)
+		self.stats.record('draw', drawn - highlighted)
+		self.stats.record('updates', updates)
+	
+	def nextBoundary(self, seconds):
+		# Sleep straight to the next state that looks different
+		return self.model.nextChange(seconds)
+	
+	def swap(self, model):
+		'''
+		Replace the model with one that was built on another thread. The swap
+		happens with the lock held, so a tick sees either the old model or the
+		new one, and the new model is drawn straight away.
+		'''
+		self.lock.acquire()
+		self.model = model
+		self.delay = model.delay
+		self.rewind()
+		self.scheduler.wake(self)
+		self.lock.release()
 	
 	def cleanup(self):
 		'''Clear window properties'''
-		truthMatrix = createTruthMatrix(self.layout.height, self.layout.width)
-		self.window.drawMatrix(truthMatrix)
-		pass
+		self.window.drawMatrix(CellState())
+
+
+class DemoThread(StateMachine):
+	'''
+	Plays through a whole day in duration seconds, starting at the current
+	time. The time of day comes from a virtual clock running DAY / duration
+	times faster than real time, and frames are paced at fps: every frame
+	shows the state the virtual clock is in at that moment. If drawing falls
+	behind, frames that are already late are dropped (along with the states
+	they would have shown) instead of slowing down the day.
 	
-	def calcDelay(self, layout):
-		'''The delay is calculated from the GCD of all time entries'''
-		return reduce(gcd, [time.toSeconds() for time in layout.times.keys()])
+	The model is read from the QlockThread on every frame, so switching
+	layouts during the demo works as usual.
+	'''
+	def __init__(self, window, qlockThread, scheduler, duration, fps = DEMO_FPS, callback = None):
+		super(DemoThread, self).__init__(qlockThread.delay, scheduler)
+		self.window = window
+		self.qlockThread = qlockThread
+		self.duration = duration
+		self.frameTime = 1.0 / fps
+		self.callback = callback
+		# The virtual clock starts with the first frame
+		self.virtualClock = None
+		self.stopped = None # Real seconds the demo ran for, once finished
+		self.frame = 0 # Index of the next frame
+		self.frames = 0 # Frames drawn
+		self.dropped = 0
+		self.skipped = 0
+		# Index and model of the state on screen
+		self.index = None
+		self.model = None
+	
+	def tick(self, now):
+		if self.virtualClock is None:
+			self.virtualClock = clock.VirtualClock(self.state.toSeconds(), float(clock.DAY) / self.duration)
+		
+		elapsed = self.virtualClock.elapsed()
+		if elapsed >= self.duration:
+			return None
+		
+		# Drop the frames whose time has already passed
+		frame = int(elapsed / self.frameTime)
+		if frame > self.frame:
+			self.dropped += frame - self.frame
+			self.frame = frame
+		self.stats.record('lateness', elapsed - frame * self.frameTime)
+		
+		start = timer()
+		self.draw(self.virtualClock.now())
+		self.stats.record('step', timer() - start)
+		self.frames += 1
+		
+		# Sleep until the next frame. If drawing took so long that the next
+		# frame is (nearly) due already, drop it too.
+		self.frame += 1
+		next = int((self.virtualClock.elapsed() + MIN_FRAME_SLEEP) / self.frameTime) + 1
+		if next > self.frame:
+			self.dropped += next - self.frame
+			self.frame = next
+		return self.frame * self.frameTime - elapsed
+	
+	def draw(self, seconds):
+		'''Draw the state of the given time of day, if it isn't already drawn'''
+		model = self.qlockThread.model
+		index = int(seconds) / model.delay
+		if index == self.index and model is self.model:
+			return
+		if self.index is not None and model is self.model:
+			self.skipped += max(index - self.index - 1, 0)
+		self.index = index
+		self.model = model
+		self.state = Time.fromSeconds(index * model.delay)
+		mask = model.highlight(model.resolve(index * model.delay))
+		start = timer()
+		updates = self.window.drawMatrix(mask)
+		self.stats.record('draw', timer() - start)
+		self.stats.record('updates', updates)
+	
+	def getReport(self):
+		'''Returns the achieved frame rate and the number of dropped frames and skipped states'''
+		if self.virtualClock is None:
+			return {'fps': 0, 'frames': 0, 'dropped': 0, 'skipped': 0}
+		elapsed = min(self.stopped or self.virtualClock.elapsed(), self.duration)
+		return {
+			'fps': self.frames / elapsed if elapsed else 0,
+			'frames': self.frames,
+			'dropped': self.dropped,
+			'skipped': self.skipped,
+		}
+	
+	def finish(self):
+		if self.virtualClock is not None:
+			self.stopped = self.virtualClock.elapsed()
+		report = self.getReport()
+		log('Demo finished: %(fps).1f fps, %(frames)d frames, %(dropped)d dropped frames, %(skipped)d skipped states' % report)
+		super(DemoThread, self).finish()
+		if self.callback:
+			self.callback()
+	
+	def cleanup(self):
+		# Unless the window is closing, leave the matrix as it is: the clock
+		# takes over from here
+		if self.scheduler.shouldStop():
+			self.window.drawMatrix(CellState())
 
 
 # Not implemented yet
 class SpriteThread(StateMachine):
-	def __init__(self, window, config):
-		super(SpriteThread, self).__init__(self.calcDelay(config))
+	def __init__(self, window, config, scheduler):
+		super(SpriteThread, self).__init__(self.calcDelay(config), scheduler)
 		self.window = window
 		self.config = config
 	
@@ -0,0 +1,93 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+from unqlocked import log
+
+import json
+import math
+
+
+class RingBuffer(object):
+	'''A fixed-size buffer of numbers that overwrites its oldest values'''
+	def __init__(self, size):
+		self.values = [0] * size
+		self.size = size
+		self.count = 0 # Total number of values ever added
+	
+	def add(self, value):
+		self.values[self.count % self.size] = value
+		self.count = self.count + 1
+	
+	def getValues(self):
+		'''Returns the values currently held, oldest first'''
+		if self.count <= self.size:
+			return self.values[:self.count]
+		start = self.count % self.size
+		return self.values[start:] + self.values[:start]
+	
+	def summary(self):
+		'''Returns the min, mean, p99 and max of the values currently held'''
+		values = sorted(self.getValues())
+		if not len(values):
+			return {'count': 0}
+		return {
+			'count': self.count,
+			'min': values[0],
+			'mean': float(sum(values)) / len(values),
+			'p99': values[int(math.ceil(0.99 * len(values))) - 1],
+			'max': values[-1],
+		}
+
+
+class TickStats(object):
+	'''
+	Timing statistics for the ticks of a state machine. Each field is kept in
+	its own ring buffer, so only the most recent ticks are summarized:
+	* lateness - seconds between the state's boundary and waking up for it
+	* solve, highlight, draw - seconds spent in each stage of step()
+	* step - total seconds spent in step()
+	* updates - number of window property updates issued by step()
+	* switch - seconds from requesting a layout switch to the new layout
+	           being swapped in
+	'''
+	FIELDS = ('lateness', 'solve', 'highlight', 'draw', 'step', 'updates', 'switch')
+	
+	def __init__(self, size = 1024):
+		self.buffers = dict([(field, RingBuffer(size)) for field in self.FIELDS])
+	
+	def record(self, field, value):
+		self.buffers[field].add(value)
+	
+	def summary(self):
+		return dict([(field, buffer.summary()) for field, buffer in self.buffers.items()])
+	
+	def log(self):
+		for field in self.FIELDS:
+			summary = self.buffers[field].summary()
+			if summary['count']:
+				log('Stats: %s min=%g mean=%g p99=%g max=%g (%d ticks)' % (field, summary['min'],
+					summary['mean'], summary['p99'], summary['max'], summary['count']))
+	
+	def dump(self, path):
+		'''Write the summary to a JSON file'''
+		try:
+			f = open(path, 'w')
+			try:
+				json.dump(self.summary(), f, indent=2, sort_keys=True)
+			finally:
+				f.close()
+			log('Wrote ' + path)
+		except:
+			log('Error writing stats file ' + path)
@@ -13,7 +13,7 @@
 # *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
 # *  http://www.gnu.org/copyleft/gpl.html
 
-from unqlocked import log, createTruthMatrix, WINDOW_ID
+from unqlocked import log, CellState, WINDOW_ID
 import config
 import gui
 import monitor
@@ -41,8 +41,13 @@ class UnqlockedWindow(xbmcgui.WindowXMLDialog):
 	def setDemoCallback(self, callback):
 		self.demoCallback = callback
 	
+	def setVisibilityCallback(self, callback):
+		'''callback(visible) is called when the window is shown or closed'''
+		self.visibilityCallback = callback
+	
 	def onInit(self):
 		self.monitor = monitor.ExitMonitor(self.exit, self.config.ssMode)
+		self.visibilityCallback(True)
 		#ctrl = self.getControl(4848)
 	
 	def drawBackground(self):
@@ -50,8 +55,11 @@ class UnqlockedWindow(xbmcgui.WindowXMLDialog):
 			for col in range(self.config.layout.width):
 				index = row * self.config.layout.width + col
 				WINDOW_HOME.setProperty(PROPERTY_INACTIVE % index, self.config.layout.matrix[row][col])
-		# Start with a state of uniform False
-		self.state = createTruthMatrix(self.config.layout.height, self.config.layout.width)
+		# Start with no cells highlighted
+		self.state = CellState()
+		# Precompute the property name and label of every cell for drawMatrix()
+		self.properties = [PROPERTY_ACTIVE % index for index in range(self.config.layout.height * self.config.layout.width)]
+		self.labels = [label for row in self.config.layout.matrix for label in row]
 	
 	def onAction(self, action):
 		actionID = action.getId()
@@ -70,17 +78,34 @@ class UnqlockedWindow(xbmcgui.WindowXMLDialog):
 			pass
 	
 	def exit(self):
+		# Let the state machines know right away, instead of at their next tick
+		self.visibilityCallback(False)
 		self.close()
 	
-	def drawMatrix(self, truthMatrix):
-		for row in range(self.config.layout.height):
-			for col in range(self.config.layout.width):
-				index = row * self.config.layout.width + col
-				if truthMatrix[row][col] and not self.state[row][col]:
-					WINDOW_HOME.setProperty(PROPERTY_ACTIVE % index, self.config.layout.matrix[row][col])
-				if not truthMatrix[row][col] and self.state[row][col]:
-					WINDOW_HOME.clearProperty(PROPERTY_ACTIVE % index)
-		self.state = truthMatrix
+	def drawMatrix(self, state):
+		'''
+		Draw a CellState of highlighted cells. Only cells that differ from the
+		previous state are visited: the XOR of the two states yields the
+		changed cells, and its set bits are iterated lowest first. Cells are
+		cleared in one batch, then set in another. Returns the number of
+		property updates.
+		'''
+		changed = state ^ self.state
+		if not changed:
+			return 0
+		cleared = []
+		highlighted = []
+		for index in changed:
+			if state.test(index):
+				highlighted.append(index)
+			else:
+				cleared.append(index)
+		for index in cleared:
+			WINDOW_HOME.clearProperty(self.properties[index])
+		for index in highlighted:
+			WINDOW_HOME.setProperty(self.properties[index], self.labels[index])
+		self.state = state
+		return len(cleared) + len(highlighted)
 	
 	def drawSprites(self, count):
 		pass
@@ -0,0 +1,261 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+'''
+Offline benchmark for UnQlocked. Every layout is run headless through each
+stage of the clock and each stage is timed separately:
+
+  parse     - parsing the layout XML file
+  solver    - building the Solver (RuleChain construction)
+  compile   - solving every state of the day
+  resolve   - resolveTime() for every state of the day
+  range     - resolveRange() over every second of an hour, walking the RuleChain
+  highlight - building the model from the solved day (Matcher and every solution)
+  draw      - drawMatrix() for every state of the day
+  model     - building the QlockThread's model (solve and highlight the day)
+  tick      - QlockThread.tick() for a day's wake-ups (at most MAX_TICKS)
+
+Besides the shipped layouts, a layout with 1-second resolution (86,400
+states per day) is synthesized and benchmarked, unless --no-seconds is
+given. For each layout the mean cost of a tick is reported, along with the
+headroom: how many times over the tick fits in the time between states, on
+this machine and on a CPU --slowdown times slower (default 20, roughly a
+first-generation Raspberry Pi compared to a desktop).
+
+Writing the window XML is timed for several matrix sizes (not just those of
+the shipped layouts), both by building the whole tree ("tree") and by
+streaming it with gui.Window.write() ("stream").
+
+Timings are the best and mean of several runs, in seconds. The number of
+window property updates issued by drawMatrix() is reported as well. Results
+are written as JSON so they can be compared across versions.
+
+Usage: python tools/benchmark.py [-n REPEAT] [-o FILE] [-s HxW,...] [--slowdown N]
+                                 [--no-seconds] [LAYOUT ...]
+'''
+
+import headless
+from unqlocked import Time, config, gui, solver, statemachine, window
+import elementtree.ElementTree
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+from xml.etree import ElementTree
+
+timer = timeit.default_timer
+
+MAX_TICKS = 3600
+
+
+class Stopwatch(object):
+	'''Collects the run times of named stages'''
+	def __init__(self):
+		self.times = {}
+	
+	def time(self, stage, function, *args):
+		'''Call function and record its run time under stage'''
+		start = timer()
+		result = function(*args)
+		self.times.setdefault(stage, []).append(timer() - start)
+		return result
+	
+	def summary(self):
+		return dict([(stage, {'min': min(times), 'mean': sum(times) / len(times)})
+		             for stage, times in self.times.items()])
+
+
+def resolveDay(solver, delay):
+	for seconds in range(0, 24 * 60 * 60, delay):
+		solver.resolveTime(Time.fromSeconds(seconds))
+
+def resolveHour(solver):
+	for seconds, tokens in solver.resolveRange(12 * 60 * 60, 13 * 60 * 60, 1):
+		pass
+
+def highlightDay(layout, clockSolver):
+	'''Build the QlockThread's model from the solved day: highlight every solution'''
+	return statemachine.QlockModel(layout, clockSolver = clockSolver)
+
+def dayMasks(model):
+	return [model.highlight(model.resolve(seconds)) for seconds in range(0, 24 * 60 * 60, model.delay)]
+
+def drawDay(unqlockedWindow, masks):
+	for mask in masks:
+		unqlockedWindow.drawMatrix(mask)
+
+def tickDay(thread, ticks):
+	now = thread.state.toSeconds()
+	for i in xrange(ticks):
+		now = (now + thread.tick(now)) % (24 * 60 * 60)
+
+def writeSecondsLayout(path):
+	'''
+	Write a layout with 1-second resolution: a digital clock showing
+	hh mm ss as six digits, one row of 0-9 per digit
+	'''
+	rows = ['\t\t' + ','.join('0123456789') for i in range(6)]
+	strings = ['\t\t<string id="%d">%s</string>' % (i, ' '.join('%02d' % i)) for i in range(60)]
+	f = open(path, 'w')
+	f.write('''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<layout>
+	<background height="6" width="10">
+%s
+	</background>
+	<times use24="true">
+		<time id="0:00:00">%%0h%% %%0m%% %%0s%%</time>
+		<time id="0:00:01">%%0h%% %%0m%% %%1s%%</time>
+	</times>
+	<strings>
+%s
+	</strings>
+</layout>
+''' % (',\n'.join(rows), '\n'.join(strings)))
+	f.close()
+
+def benchmarkLayout(path, repeat, slowdown):
+	stopwatch = Stopwatch()
+	for i in range(repeat):
+		layout = stopwatch.time('parse', config.Layout, path)
+		delay = statemachine.QlockModel.calcDelay(layout)
+		
+		clockSolver = stopwatch.time('solver', solver.Solver, layout, delay)
+		stopwatch.time('range', resolveHour, clockSolver)
+		stopwatch.time('compile', clockSolver.compile)
+		stopwatch.time('resolve', resolveDay, clockSolver, delay)
+		
+		model = stopwatch.time('highlight', highlightDay, layout, clockSolver)
+		masks = dayMasks(model)
+		
+		unqlockedWindow = window.UnqlockedWindow('unqlocked.xml', '', 'Default')
+		unqlockedWindow.setConfig(headless.FakeConfig(layout))
+		unqlockedWindow.drawBackground()
+		properties = window.WINDOW_HOME
+		properties.sets = properties.clears = 0
+		stopwatch.time('draw', drawDay, unqlockedWindow, masks)
+		
+		scheduler = statemachine.Scheduler() # Not started, ticks are called directly
+		thread = stopwatch.time('model', statemachine.QlockThread, unqlockedWindow, layout, scheduler)
+		ticks = min(len(thread.model.changes) or 1, MAX_TICKS)
+		stopwatch.time('tick', tickDay, thread, ticks)
+	
+	perTick = min(stopwatch.times['tick']) / ticks
+	return {
+		'delay': delay,
+		'states': len(clockSolver.table),
+		'nodes': clockSolver.countNodes(),
+		'rules': len(layout.times),
+		'cells': layout.width * layout.height,
+		'stages': stopwatch.summary(),
+		'properties': {'sets': properties.sets, 'clears': properties.clears},
+		'tick': {
+			'ticks': ticks,
+			'perTick': perTick,
+			'headroom': delay / perTick,
+			'slowHeadroom': delay / (perTick * slowdown),
+		},
+	}
+
+class SkinLayout(object):
+	'''The subset of config.Layout used by gui.Window'''
+	def __init__(self, height, width):
+		self.height = height
+		self.width = width
+
+class SkinTheme(object):
+	'''The subset of config.Theme used by gui.Window'''
+	background = 'ff000000'
+	active = 'ffffffff'
+	inactive = 'ff404040'
+	image = None
+	imageWidth = 1280
+	imageHeight = 720
+
+def writeTree(windowGUI, path):
+	elementtree.ElementTree.ElementTree(windowGUI.toXMLPrettyPlease()).write(path)
+
+def benchmarkSkin(height, width, repeat):
+	windowGUI = gui.Window(SkinLayout(height, width), SkinTheme(), True)
+	stopwatch = Stopwatch()
+	tempDir = tempfile.mkdtemp()
+	try:
+		path = os.path.join(tempDir, 'unqlocked.xml')
+		for i in range(repeat):
+			stopwatch.time('tree', writeTree, windowGUI, path)
+			stopwatch.time('stream', windowGUI.write, path)
+		size = os.path.getsize(path)
+	finally:
+		shutil.rmtree(tempDir)
+	return {'cells': height * width, 'bytes': size, 'stages': stopwatch.summary()}
+
+def parseSize(size):
+	height, width = size.lower().split('x')
+	return int(height), int(width)
+
+def addonVersion():
+	root = ElementTree.parse(os.path.join(headless.ADDON_DIR, 'addon.xml')).getroot()
+	return root.attrib['version']
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark UnQlocked layouts')
+	parser.add_argument('-n', '--repeat', type=int, default=5, help='runs per layout (default 5)')
+	parser.add_argument('-o', '--output', help='write JSON results to this file instead of stdout')
+	parser.add_argument('-s', '--skin-sizes', default='10x11,20x40',
+	                    help='matrix sizes for the window XML benchmark, as HxW,... (default 10x11,20x40)')
+	parser.add_argument('--slowdown', type=float, default=20,
+	                    help='how many times slower the target CPU is, for the headroom estimate (default 20)')
+	parser.add_argument('--no-seconds', action='store_true', help="don't benchmark a 1-second layout")
+	parser.add_argument('layouts', nargs='*', help='layout files (default: all shipped layouts)')
+	args = parser.parse_args()
+	
+	results = {
+		'version': addonVersion(),
+		'python': sys.version.split()[0],
+		'platform': sys.platform,
+		'repeat': args.repeat,
+		'slowdown': args.slowdown,
+		'layouts': {},
+		'skin': {},
+	}
+	paths = args.layouts or headless.listLayouts()
+	tempDir = tempfile.mkdtemp()
+	try:
+		if not args.no_seconds:
+			paths = paths + [os.path.join(tempDir, 'Seconds 6x10.xml')]
+			writeSecondsLayout(paths[-1])
+		for path in paths:
+			name = os.path.splitext(os.path.basename(path))[0]
+			sys.stderr.write('Benchmarking %s\n' % name)
+			results['layouts'][name] = benchmarkLayout(path, args.repeat, args.slowdown)
+	finally:
+		shutil.rmtree(tempDir)
+	for size in args.skin_sizes.split(','):
+		sys.stderr.write('Benchmarking window XML for %s\n' % size)
+		results['skin'][size] = benchmarkSkin(*(parseSize(size) + (args.repeat,)))
+	
+	output = json.dumps(results, indent=2, sort_keys=True)
+	if args.output:
+		f = open(args.output, 'w')
+		f.write(output + '\n')
+		f.close()
+	else:
+		print(output)
+
+if __name__ == '__main__':
+	main()
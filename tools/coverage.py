@@ -0,0 +1,150 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+'''
+Layout coverage analyzer. Every state of the day is solved and highlighted
+for every layout, with layouts spread across a process pool. For each layout
+the report lists:
+
+  * times whose solution can't be highlighted (and whether highlighting
+    succeeds when consecutive words are allowed without a space)
+  * the number of distinct display states
+  * the number of display changes and cell transitions per day
+  * a heatmap of how much of the day each cell is lit
+
+Solutions and masks are deduplicated before any per-cell work is done, so a
+sweep costs little more than solving the day.
+
+Usage: python tools/coverage.py [-j JOBS] [--json] [LAYOUT ...]
+'''
+
+import headless
+from unqlocked import Time, config, statemachine
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+
+def analyzeLayout(path):
+	'''Solve and highlight every state of the day for a single layout'''
+	layout = config.Layout(path)
+	# Build the same model as the clock, so the analysis can't drift from it
+	model = statemachine.QlockModel(layout)
+	delay = model.delay
+	states = range(0, 24 * 60 * 60, delay)
+	
+	failures = []
+	for seconds, solution, withoutSpaces in model.failures:
+		time = Time.fromSeconds(seconds)
+		time.useSeconds = delay % 60 != 0
+		failures.append({
+			'time': str(time),
+			'solution': u' '.join(solution),
+			'withoutSpaces': withoutSpaces,
+		})
+	
+	# Count how often each display state occurs, and the transitions between
+	# consecutive states (wrapping around at midnight)
+	occurrences = {}
+	changes = 0
+	transitions = 0
+	previous = model.highlight(model.resolve(states[-1]))
+	for seconds in states:
+		mask = model.highlight(model.resolve(seconds))
+		occurrences[mask] = occurrences.get(mask, 0) + 1
+		if mask != previous:
+			changes = changes + 1
+			transitions = transitions + (mask ^ previous).popcount()
+		previous = mask
+	
+	# Seconds per day that each cell is lit
+	heatmap = [0] * (layout.width * layout.height)
+	for mask, count in occurrences.items():
+		for index in mask:
+			heatmap[index] = heatmap[index] + count * delay
+	
+	return {
+		'name': os.path.splitext(os.path.basename(path))[0],
+		'width': layout.width,
+		'height': layout.height,
+		'matrix': layout.matrix,
+		'delay': delay,
+		'states': len(states),
+		'solutions': model.solutionCount,
+		'displayStates': len(occurrences),
+		'changes': changes,
+		'transitions': transitions,
+		'failures': failures,
+		'heatmap': [heatmap[row * layout.width : (row + 1) * layout.width] for row in range(layout.height)],
+	}
+
+def formatReport(result):
+	lines = []
+	lines.append(u'== %s (%dx%d, %d second states) ==' % (result['name'], result['height'], result['width'], result['delay']))
+	lines.append(u'States per day:           %d' % result['states'])
+	lines.append(u'Distinct solutions:       %d' % result['solutions'])
+	lines.append(u'Distinct display states:  %d' % result['displayStates'])
+	lines.append(u'Display changes per day:  %d' % result['changes'])
+	lines.append(u'Cell transitions per day: %d' % result['transitions'])
+	if result['failures']:
+		lines.append(u'Unhighlightable times: %d' % len(result['failures']))
+		for failure in result['failures']:
+			lines.append(u'  %s: "%s"%s' % (failure['time'], failure['solution'],
+				u' (ok without spaces)' if failure['withoutSpaces'] else u''))
+	else:
+		lines.append(u'Unhighlightable times: none')
+	lines.append(u'Heatmap (percent of the day each cell is lit):')
+	for row in range(result['height']):
+		cells = []
+		for col in range(result['width']):
+			seconds = result['heatmap'][row][col]
+			percent = u'%d' % (100 * seconds / (24 * 60 * 60)) if seconds else u'.'
+			cells.append(u'%2s%4s' % (result['matrix'][row][col], percent))
+		lines.append(u'  ' + u' '.join(cells))
+	return u'\n'.join(lines)
+
+def main():
+	parser = argparse.ArgumentParser(description='Analyze how well UnQlocked layouts cover the day')
+	parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='worker processes (default: one per CPU)')
+	parser.add_argument('--json', action='store_true', help='print the results as JSON')
+	parser.add_argument('layouts', nargs='*', help='layout files (default: all shipped layouts)')
+	args = parser.parse_args()
+	
+	paths = args.layouts or headless.listLayouts()
+	if args.jobs > 1 and len(paths) > 1:
+		pool = multiprocessing.Pool(min(args.jobs, len(paths)))
+		results = pool.map(analyzeLayout, paths)
+		pool.close()
+		pool.join()
+	else:
+		results = map(analyzeLayout, paths)
+	
+	if args.json:
+		print(json.dumps(results, indent=2, sort_keys=True))
+	else:
+		report = u'\n\n'.join([formatReport(result) for result in results])
+		print(report.encode('utf-8'))
+	
+	# Exit with an error if any layout has a solution that can't be fully
+	# highlighted, even without spaces
+	for result in results:
+		if [failure for failure in result['failures'] if not failure['withoutSpaces']]:
+			sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,172 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+'''
+Solver equivalence sweep. The solver answers lookups from flattened arrays
+and compiled templates instead of walking the RuleChain's linked lists and
+stringifying tokens, as the original solver did. This tool solves every state
+of the day both ways and reports any time where they disagree:
+
+  table - resolveTime() after compile()
+  range - RuleChain.lookupRange() over the whole day, before compile()
+
+The reference walks the linked lists built by RuleChain.add() exactly like
+the original lookup: start at the hour's first node and move on while the
+next node starts no later than the time.
+
+Besides the shipped layouts, random rule sets are generated (with durations,
+symbols and overlapping rules) to reach corners the shipped layouts don't.
+Ranges are solved every minute (or every state, for layouts with a shorter
+delay), and the table at the start of every state.
+
+Usage: python tools/equivalence.py [-n COUNT] [--seed SEED] [-v] [LAYOUT ...]
+'''
+
+import headless
+from unqlocked import Time, config, solver, statemachine
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+
+def referenceSolve(clockSolver, time):
+	'''Solve for a time the way the original solver did, by walking the chain'''
+	clockSolver.time.hours = time.hours
+	clockSolver.time.minutes = time.minutes
+	clockSolver.time.seconds = time.seconds
+	chain = clockSolver.rules
+	node = chain.rules[time.hours % (24 if chain.use24 else 12)]
+	if node is None:
+		return ()
+	while node.next:
+		# Compare minutes and seconds (by making the hours equal)
+		if Time(node.next.time.hours, time.minutes, time.seconds).toSeconds() < node.next.time.toSeconds():
+			break
+		node = node.next
+	tokens = []
+	for token in node.rule:
+		s = unicode(token)
+		if s == '':
+			continue # String table ID not found
+		tokens.extend(s.split(' '))
+	return tuple(tokens)
+
+def sweepLayout(path, verbose = False):
+	'''Returns the number of lookups where the solver disagrees with the reference'''
+	layout = config.Layout(path)
+	delay = statemachine.QlockModel.calcDelay(layout)
+	clockSolver = solver.Solver(layout, delay)
+	step = min(delay, 60)
+	
+	# lookupRange() solves any time, so check every step. The table only
+	# holds the start of each state.
+	ranged = list(clockSolver.rules.lookupRange(0, 24 * 60 * 60, step))
+	clockSolver.compile()
+	table = [(seconds, clockSolver.resolveTime(Time.fromSeconds(seconds))) for seconds in range(0, 24 * 60 * 60, delay)]
+	
+	mismatches = 0
+	for name, results in (('range', ranged), ('table', table)):
+		for seconds, tokens in results:
+			time = Time.fromSeconds(seconds)
+			time.useSeconds = seconds % 60 != 0
+			expected = referenceSolve(clockSolver, time)
+			if tuple(tokens) != expected:
+				mismatches = mismatches + 1
+				if verbose:
+					sys.stderr.write('%s %s (%s): "%s", expected "%s"\n' % (os.path.basename(path), str(time),
+						name, u' '.join(tokens).encode('utf-8'), u' '.join(expected).encode('utf-8')))
+	return mismatches
+
+def randomToken(rng, hours, minutes):
+	kind = rng.randint(0, 3)
+	if kind == 0:
+		return 'c%d' % rng.randint(0, 9)
+	elif kind == 1:
+		return '%%%dh%%' % rng.choice([hours, rng.randint(1, 12)])
+	elif kind == 2:
+		return '%%%dm%%' % rng.choice([minutes, rng.randint(0, 59)])
+	else:
+		return 'x%%%dh%%' % hours # Compound
+
+def writeRandomLayout(path, rng):
+	'''Write a small layout with a random set of rules'''
+	times = {}
+	for i in range(rng.randint(1, 6)):
+		hours = rng.randint(1, 12)
+		minutes = rng.randrange(0, 60, 5)
+		attrib = ''
+		if rng.random() < 0.4:
+			duration = rng.randrange(5, 120, 5)
+			attrib = ' duration="%d:%02d"' % (duration / 60, duration % 60)
+		words = [randomToken(rng, hours, minutes) for j in range(rng.randint(1, 4))]
+		times['%d:%02d' % (hours, minutes)] = '\t\t<time id="%d:%02d"%s>%s</time>' % \
+			(hours, minutes, attrib, ' '.join(words))
+	strings = ['\t\t<string id="%d">w%d</string>' % (i, i) for i in range(61) if rng.random() < 0.95]
+	f = open(path, 'w')
+	f.write('''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<layout>
+	<background height="1" width="1">
+		a
+	</background>
+	<times>
+%s
+	</times>
+	<strings>
+%s
+	</strings>
+</layout>
+''' % ('\n'.join(times.values()), '\n'.join(strings)))
+	f.close()
+
+def main():
+	parser = argparse.ArgumentParser(description='Check the solver against a walk of the RuleChain')
+	parser.add_argument('-n', '--count', type=int, default=200, help='random rule sets to check (default 200)')
+	parser.add_argument('--seed', type=int, default=0, help='seed for the random rule sets (default 0)')
+	parser.add_argument('-v', '--verbose', action='store_true', help='print every mismatch')
+	parser.add_argument('layouts', nargs='*', help='layout files (default: all shipped layouts)')
+	args = parser.parse_args()
+	
+	failed = 0
+	for path in args.layouts or headless.listLayouts():
+		mismatches = sweepLayout(path, args.verbose)
+		print('%s: %d mismatches' % (os.path.splitext(os.path.basename(path))[0], mismatches))
+		if mismatches:
+			failed = failed + 1
+	
+	rng = random.Random(args.seed)
+	tempDir = tempfile.mkdtemp()
+	try:
+		randomFailed = 0
+		for i in range(args.count):
+			path = os.path.join(tempDir, 'random-%d.xml' % i)
+			writeRandomLayout(path, rng)
+			if sweepLayout(path, args.verbose):
+				randomFailed = randomFailed + 1
+				# Keep the failing rule set around for inspection
+				shutil.copy(path, os.path.join(tempfile.gettempdir(), 'unqlocked-mismatch-%d.xml' % i))
+		print('Random rule sets: %d of %d with mismatches' % (randomFailed, args.count))
+		failed = failed + randomFailed
+	finally:
+		shutil.rmtree(tempDir)
+	
+	if failed:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
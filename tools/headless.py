@@ -0,0 +1,42 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+'''
+Shared setup for the command-line tools. Importing this module puts the stub
+XBMC modules and the addon on the path, so that the unqlocked package can be
+used outside of XBMC.
+'''
+
+import os
+import sys
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.join(os.path.dirname(TOOLS_DIR), 'script.unqlocked')
+LAYOUT_DIR = os.path.join(ADDON_DIR, 'layouts')
+
+sys.path.insert(0, ADDON_DIR)
+sys.path.insert(0, os.path.join(TOOLS_DIR, 'stubs'))
+
+
+def listLayouts(layoutDir = LAYOUT_DIR):
+	'''Returns the full path of every layout in layoutDir, sorted by name'''
+	return [os.path.join(layoutDir, name) for name in sorted(os.listdir(layoutDir)) if name[-4:] == '.xml']
+
+
+class FakeConfig(object):
+	'''The subset of config.Config used by window.UnqlockedWindow'''
+	def __init__(self, layout, ssMode = True):
+		self.layout = layout
+		self.ssMode = ssMode
@@ -0,0 +1,55 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+'''
+Minimal stand-in for XBMC's xbmc module, enough to run UnQlocked's solver,
+highlighter and renderer outside of XBMC.
+'''
+
+import os
+
+LOGDEBUG = 0
+LOGNOTICE = 2
+LOGERROR = 4
+
+# Set to True to print log messages to stdout
+verbose = False
+
+def log(msg, level = LOGNOTICE):
+	if verbose:
+		print(msg)
+
+def getCondVisibility(condition):
+	return False
+
+def translatePath(path):
+	# There is no skin outside of XBMC. Point special://skin/ at a directory
+	# without a Font.xml so that the default font is used.
+	if path.startswith('special://skin'):
+		return os.path.dirname(os.path.abspath(__file__))
+	return path
+
+def getSkinDir():
+	return 'skin.confluence'
+
+def getLanguage():
+	return 'english'
+
+def sleep(milliseconds):
+	pass
+
+
+class Monitor(object):
+	pass
@@ -0,0 +1,30 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+'''Minimal stand-in for XBMC's xbmcaddon module'''
+
+
+class Addon(object):
+	def __init__(self, id = None):
+		self.settings = {}
+	
+	def getAddonInfo(self, key):
+		return ''
+	
+	def getSetting(self, key):
+		return self.settings.get(key, 'Default')
+	
+	def setSetting(self, key, value):
+		self.settings[key] = value
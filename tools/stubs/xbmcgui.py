@@ -0,0 +1,46 @@
+# *  This Program is free software; you can redistribute it and/or modify
+# *  it under the terms of the GNU General Public License as published by
+# *  the Free Software Foundation; either version 2, or (at your option)
+# *  any later version.
+# *
+# *  This Program is distributed in the hope that it will be useful,
+# *  but WITHOUT ANY WARRANTY; without even the implied warranty of
+# *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# *  GNU General Public License for more details.
+# *
+# *  You should have received a copy of the GNU General Public License
+# *  along with XBMC; see the file COPYING.  If not, write to
+# *  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+# *  http://www.gnu.org/copyleft/gpl.html
+
+'''
+Minimal stand-in for XBMC's xbmcgui module. Window properties are kept in a
+dictionary, and every set/clear is counted so that property traffic can be
+measured.
+'''
+
+
+class Window(object):
+	def __init__(self, windowId = 0):
+		self.properties = {}
+		self.sets = 0
+		self.clears = 0
+	
+	def setProperty(self, key, value):
+		self.properties[key] = value
+		self.sets = self.sets + 1
+	
+	def clearProperty(self, key):
+		self.properties.pop(key, None)
+		self.clears = self.clears + 1
+	
+	def getProperty(self, key):
+		return self.properties.get(key, '')
+
+
+class WindowXMLDialog(Window):
+	def __init__(self, *args):
+		super(WindowXMLDialog, self).__init__()
+	
+	def close(self):
+		pass